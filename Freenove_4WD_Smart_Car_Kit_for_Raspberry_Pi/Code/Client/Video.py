@@ -9,6 +9,7 @@ import struct
 from PIL import Image
 from multiprocessing import Process
 from Command import COMMAND as cmd
+import Protocol
 
 class VideoStreaming:
     def __init__(self):
@@ -17,15 +18,21 @@ class VideoStreaming:
         self.connect_Flag=False
         self.face_x=0
         self.face_y=0
+        self.binary=False   # send commands as Protocol.py binary frames instead of text
+        self.udp=False      # send motion commands over the UDP control port (5001)
+        self.seq=0
+        self.ip=None
     def StartTcpClient(self,IP):
         self.client_socket1 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     def StopTcpcClient(self):
         try:
             self.client_socket.shutdown(2)
             self.client_socket1.shutdown(2)
             self.client_socket.close()
             self.client_socket1.close()
+            self.control_socket.close()
         except:
             pass
 
@@ -79,7 +86,36 @@ class VideoStreaming:
                   
     def sendData(self,s):
         if self.connect_Flag:
-            self.client_socket1.send(s.encode('utf-8'))
+            if self.udp:
+                s=self.sendControl(s)
+                if not s:
+                    return
+            if self.binary:
+                self.client_socket1.sendall(Protocol.encodeLine(s))
+            else:
+                self.client_socket1.send(s.encode('utf-8'))
+
+    def sendControl(self,s):
+        "Sends the motion commands in s as one UDP datagram, returns the lines that also need TCP"
+        control=[]
+        rest=[]
+        for line in s.split('\n'):
+            if line:
+                data=line.split('#')
+                if data[0] in Protocol.CONTROL_COMMANDS:
+                    control.append(line+'\n')
+                    if data[0]!=cmd.CMD_SERVO and all(field in ('','0') for field in data[1:]):
+                        # A stop (key released) must not be lost, nothing else would stop the car
+                        rest.append(line+'\n')
+                else:
+                    rest.append(line+'\n')
+        if control:
+            self.seq=(self.seq+1)&0xFFFFFFFF
+            try:
+                self.control_socket.sendto(Protocol.encodeDatagram(self.seq,''.join(control)),(self.ip,5001))
+            except OSError:
+                pass
+        return ''.join(rest)
 
     def recvData(self):
         data=""
@@ -92,6 +128,7 @@ class VideoStreaming:
     def socket1_connect(self,ip):
         try:
             self.client_socket1.connect((ip, 5000))
+            self.ip=ip
             self.connect_Flag=True
             print ("Connection Successful !")
         except Exception as e:
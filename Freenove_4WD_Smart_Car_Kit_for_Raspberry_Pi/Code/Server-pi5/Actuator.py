@@ -0,0 +1,61 @@
+import threading
+
+
+class Actuator(threading.Thread):
+    """Worker thread that writes actuator targets to the hardware.
+
+    Every channel ('motor', 'servo0', ...) has a one-slot mailbox. post()
+    only replaces the slot, so the network thread never waits on I2C and a
+    burst of commands collapses into the newest target per channel.
+    """
+    def __init__(self):
+        super().__init__(name='Actuator', daemon=True)
+        self.condition = threading.Condition()
+        self.mailbox = {}       # channel -> (function, args)
+        self.running = True
+        self.posted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def post(self, channel, function, *args):
+        with self.condition:
+            if channel in self.mailbox:
+                self.coalesced += 1
+            self.mailbox[channel] = (function, args)
+            self.posted += 1
+            self.condition.notify()
+
+    def depth(self):
+        with self.condition:
+            return len(self.mailbox)
+
+    def stats(self):
+        with self.condition:
+            return {'depth': len(self.mailbox), 'posted': self.posted, 'applied': self.applied,
+                    'coalesced': self.coalesced, 'errors': self.errors}
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.mailbox:
+                    self.condition.wait()
+                if not self.mailbox:
+                    break
+                pending = self.mailbox
+                self.mailbox = {}
+            for channel, (function, args) in pending.items():
+                try:
+                    function(*args)
+                except Exception as e:
+                    self.errors += 1
+                    print('Actuator ' + channel + ' failed: ' + str(e))
+                self.applied += 1
+
+    def stop(self):
+        "Applies what is still pending, then ends the worker"
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
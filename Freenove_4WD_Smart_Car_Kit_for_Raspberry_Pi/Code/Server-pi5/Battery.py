@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from ADC import Adc
+from Filters import EMA
+from FixedRate import FixedRate
+
+# Resting voltage of the 2S 18650 pack against remaining charge, unit: V, %
+DISCHARGE_CURVE = ((6.0, 0), (6.4, 5), (6.7, 12), (7.0, 25), (7.2, 40),
+                   (7.4, 55), (7.6, 68), (7.8, 80), (8.0, 90), (8.4, 100))
+
+# Buzzer patterns, (on seconds, off seconds) per beep
+PATTERN_LOW = ((0.1, 0.1),) * 2
+PATTERN_CRITICAL = ((0.1, 0.1),) * 4
+
+
+def percentage(voltage):
+    "Remaining charge in % for a pack voltage, interpolated on DISCHARGE_CURVE"
+    if voltage <= DISCHARGE_CURVE[0][0]:
+        return 0
+    for (v0, p0), (v1, p1) in zip(DISCHARGE_CURVE, DISCHARGE_CURVE[1:]):
+        if voltage <= v1:
+            return int(p0 + (p1 - p0) * (voltage - v0) / (v1 - v0))
+    return 100
+
+
+class BuzzerPattern(threading.Thread):
+    """Plays beep patterns on a Buzzer from its own thread.
+
+    play() returns at once; a new pattern replaces the one in progress.
+    """
+    def __init__(self, buzzer):
+        super().__init__(name='BuzzerPattern', daemon=True)
+        self.buzzer = buzzer
+        self.condition = threading.Condition()
+        self.pattern = None
+        self.running = True
+
+    def play(self, pattern):
+        with self.condition:
+            self.pattern = pattern
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pattern is None:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                pattern = self.pattern
+                self.pattern = None
+            for on, off in pattern:
+                self.buzzer.run('1')
+                with self.condition:
+                    self.condition.wait_for(lambda: self.pattern is not None or not self.running, on)
+                self.buzzer.run('0')
+                with self.condition:
+                    if self.condition.wait_for(lambda: self.pattern is not None or not self.running, off):
+                        break
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
+
+
+class Battery(threading.Thread):
+    """Tracks the battery voltage in the background.
+
+    Samples the pack voltage (ADC channel 2, through the ADC sampler) every
+    `period` seconds into an EMA and a history ring, so voltage(),
+    percent() and compensation() return at once from the cached value.
+    Warning beeps go through a BuzzerPattern once a buzzer is attached.
+    """
+    def __init__(self, adc, period=1.0, size=300, alpha=0.2, low=7.0, critical=6.5, alert_period=3.0):
+        super().__init__(name='Battery', daemon=True)
+        self.adc = adc
+        self.period = period
+        self.schedule = FixedRate(period)
+        self.ema = EMA(alpha)
+        self.history = deque(maxlen=size)    # (timestamp, smoothed voltage)
+        self.low = low
+        self.critical = critical
+        self.alert_period = alert_period
+        self.alerts = None
+        self.last_alert = 0.0
+        self.lock = threading.Lock()
+        self.value = None
+
+    def setBuzzer(self, buzzer):
+        if self.alerts is None:
+            self.alerts = BuzzerPattern(buzzer)
+            self.alerts.start()
+
+    def sample(self):
+        raw = self.adc.recvADC(2) * 3
+        stamp = time.monotonic()
+        with self.lock:
+            self.value = self.ema.update(raw)
+            self.history.append((stamp, self.value))
+            return self.value
+
+    def voltage(self):
+        "Smoothed pack voltage, unit: V"
+        with self.lock:
+            value = self.value
+        if value is None:
+            value = self.sample()
+        return value
+
+    def percent(self):
+        return percentage(self.voltage())
+
+    def compensation(self, nominal=7.5):
+        "Factor that scales timings tuned at `nominal` volts to the current voltage"
+        return nominal / self.voltage()
+
+    def alert(self, voltage):
+        if self.alerts is None or time.monotonic() - self.last_alert < self.alert_period:
+            return
+        if voltage < self.critical:
+            self.alerts.play(PATTERN_CRITICAL)
+        elif voltage < self.low:
+            self.alerts.play(PATTERN_LOW)
+        else:
+            return
+        self.last_alert = time.monotonic()
+
+    def check(self):
+        try:
+            self.alert(self.sample())
+        except OSError:
+            pass
+
+    def run(self):
+        self.schedule.run(self.check)
+
+    def stop(self):
+        self.schedule.stop()
+        if self.alerts is not None:
+            self.alerts.stop()
+
+
+# One monitor per process, shared by the server and every Motor
+_battery = None
+_battery_lock = threading.Lock()
+
+
+def getBattery(adc=None):
+    "The process-wide Battery monitor, started on first use"
+    global _battery
+    with _battery_lock:
+        if _battery is None:
+            _battery = Battery(adc or Adc())
+            _battery.start()
+        return _battery
@@ -0,0 +1,74 @@
+import bisect
+from collections import deque
+
+# ============================================================================
+# Streaming filters for sensor channels
+# Every filter takes one sample per update() call and returns the current
+# output, with a fixed cost per sample.
+# ============================================================================
+
+class RunningMedian:
+    "Median of the last `size` samples, kept sorted incrementally"
+    def __init__(self, size=5):
+        self.size = size
+        self.window = deque()
+        self.ordered = []
+
+    def update(self, value):
+        self.window.append(value)
+        bisect.insort(self.ordered, value)
+        if len(self.window) > self.size:
+            old = self.window.popleft()
+            del self.ordered[bisect.bisect_left(self.ordered, old)]
+        return self.ordered[len(self.ordered) // 2]
+
+    def reset(self):
+        self.window.clear()
+        self.ordered = []
+
+
+class EMA:
+    "Exponential moving average, alpha is the weight of the newest sample"
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class Hysteresis:
+    "Holds the output until the input moves at least `threshold` away from it"
+    def __init__(self, threshold=0.05):
+        self.threshold = threshold
+        self.value = None
+
+    def update(self, value):
+        if self.value is None or abs(value - self.value) >= self.threshold:
+            self.value = value
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class Chain:
+    "Runs a sample through several filters in order"
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def update(self, value):
+        for f in self.filters:
+            value = f.update(value)
+        return value
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
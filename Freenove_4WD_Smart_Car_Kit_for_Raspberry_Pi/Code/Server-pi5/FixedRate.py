@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import deque
+
+
+class FixedRate:
+    """A fixed-rate schedule on time.monotonic() deadlines.
+
+    run() calls a function every `period` seconds until stop(). A call
+    that ends past its deadline counts as an overrun, and the schedule
+    restarts from now instead of bursting. stop() also cuts the sleep
+    short. The periodic threads all run on this, so overruns and stats()
+    mean the same everywhere.
+    """
+    def __init__(self, period, window=1000):
+        self.period = period
+        self.stop_event = threading.Event()
+        self.durations = deque(maxlen=window)   # seconds per call, for stats()
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+
+    def tick(self, function, *args):
+        "Calls function once, timed, and moves the deadline on"
+        start = time.monotonic()
+        if self.deadline is None:
+            self.deadline = start
+        try:
+            return function(*args)
+        finally:
+            end = time.monotonic()
+            self.durations.append(end - start)
+            self.ticks += 1
+            self.deadline += self.period
+            if self.deadline < end:
+                self.overruns += 1
+                self.deadline = end
+
+    def wait(self):
+        "Sleeps until the next deadline, returns True once stop() was called"
+        return self.stop_event.wait(max(0.0, self.deadline - time.monotonic()))
+
+    def run(self, function, *args):
+        while not self.stop_event.is_set():
+            self.tick(function, *args)
+            self.wait()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        durations = sorted(self.durations)
+        if not durations:
+            return {'ticks': self.ticks, 'overruns': self.overruns, 'mean': 0.0, 'p99': 0.0}
+        return {'ticks': self.ticks, 'overruns': self.overruns,
+                'mean': sum(durations) / len(durations),
+                'p99': durations[int(0.99 * (len(durations) - 1))]}
@@ -0,0 +1,89 @@
+import threading
+import smbus
+from PCA9685 import PCA9685
+
+# ============================================================================
+# Process-wide I2C bus manager
+# Motor, Servo, Adc, Light and Ultrasonic all talk to the same bus and the
+# same PCA9685, so they share one handle per device instead of opening
+# their own.
+# ============================================================================
+
+class SharedBus:
+    "smbus.SMBus wrapper that serializes every transaction with one lock"
+    def __init__(self, bus=1):
+        self.bus = smbus.SMBus(bus)
+        self.lock = threading.RLock()
+
+    def write_byte_data(self, address, reg, value):
+        with self.lock:
+            self.bus.write_byte_data(address, reg, value)
+
+    def read_byte_data(self, address, reg):
+        with self.lock:
+            return self.bus.read_byte_data(address, reg)
+
+    def write_byte(self, address, value):
+        with self.lock:
+            self.bus.write_byte(address, value)
+
+    def read_byte(self, address):
+        with self.lock:
+            return self.bus.read_byte(address)
+
+    def write_i2c_block_data(self, address, reg, values):
+        with self.lock:
+            self.bus.write_i2c_block_data(address, reg, values)
+
+    def read_i2c_block_data(self, address, reg, length):
+        with self.lock:
+            return self.bus.read_i2c_block_data(address, reg, length)
+
+    def close(self):
+        # The handle is shared by every driver in the process, keep it open
+        pass
+
+
+_lock = threading.Lock()
+_bus = None
+_pca9685 = {}      # address -> PCA9685
+_pwm_freq = {}     # address -> [frequency, exact]
+
+
+def getBus():
+    "Returns the shared bus 1 handle, opening it on first use"
+    global _bus
+    with _lock:
+        if _bus is None:
+            _bus = SharedBus(1)
+        return _bus
+
+
+def getPCA9685(address=0x40, freq=50, exact=False):
+    """Returns the shared PCA9685 at address, initialized once per process.
+
+    Every channel of the chip runs at one PWM frequency. An exact request
+    (servos, whose pulse widths assume a 20 ms period) fixes it; other
+    requests (motors, which only care about the duty ratio) are applied
+    only while nobody needs an exact frequency.
+    """
+    bus = getBus()
+    with _lock:
+        pwm = _pca9685.get(address)
+        if pwm is None:
+            pwm = PCA9685(address, debug=True, auto_increment=True, bus=bus)
+            _pca9685[address] = pwm
+        current = _pwm_freq.get(address)
+        if current is None:
+            pwm.setPWMFreq(freq)
+            _pwm_freq[address] = [freq, exact]
+        elif current[0] == freq:
+            current[1] = current[1] or exact
+        elif exact and not current[1]:
+            pwm.setPWMFreq(freq)
+            _pwm_freq[address] = [freq, exact]
+        elif exact:
+            raise ValueError("PCA9685 0x%02x is already fixed at %d Hz, cannot set %d Hz" % (address, current[0], freq))
+        else:
+            print("PCA9685 0x%02x stays at %d Hz (requested %d Hz)" % (address, current[0], freq))
+        return pwm
@@ -1,15 +1,30 @@
+import threading
 import time
 from Motor import *
 from gpiozero import LineSensor
+from ControlLoop import ControlLoop
 IR01 = 14
 IR02 = 15
 IR03 = 23
 IR01_sensor = LineSensor(IR01)
 IR02_sensor = LineSensor(IR02)
 IR03_sensor = LineSensor(IR03)
+# LMRの状態(左=4,中=2,右=1) -> 各車輪のデューティ。表にない状態は直前の指令を保つ
+MOTOR_TABLE={
+    2:(800,800,800,800),
+    4:(-1500,-1500,2500,2500),
+    6:(-2000,-2000,4000,4000),
+    1:(2500,2500,-1500,-1500),
+    3:(4000,4000,-2000,-2000),
+    7:(0,0,0,0),
+}
 class Line_Tracking:
     def __init__(self):
-        pass
+        self.rate=100       # 1秒あたりのティック数。エッジへの反応時間の上限になる
+        self.period=0.02    # エッジが来ないときに読み直すまでの最大時間
+        self.read_at=0.0    # 最後に読んだ時刻(monotonic)
+        self.LMR=None
+        self.changed=threading.Event()
 
     def test_Infrared(self):
         try:
@@ -23,28 +38,47 @@ class Line_Tracking:
         except KeyboardInterrupt:
             print ("\nEnd of program")
         
+    def readLMR(self):
+        # 3つのセンサーを2回続けて同じ値になるまで読み、異なる瞬間の値が混ざらないようにする
+        state=None
+        for i in range(3):
+            sample=(4 if IR01_sensor.value else 0)|(2 if IR02_sensor.value else 0)|(1 if IR03_sensor.value else 0)
+            if sample==state:
+                break
+            state=sample
+        return state
+    def onEdge(self):
+        self.changed.set()
+    def setup(self):
+        for sensor in (IR01_sensor,IR02_sensor,IR03_sensor):
+            sensor.when_line=self.onEdge
+            sensor.when_no_line=self.onEdge
+        self.LMR=None
+        self.changed.set()
+    def sense(self):
+        # エッジが来たとき、またはエッジを取りこぼしたときのためにperiodごとにセンサーを読み直す
+        now=time.monotonic()
+        if not self.changed.is_set() and now-self.read_at<self.period:
+            return self.LMR
+        self.changed.clear()
+        self.read_at=now
+        return self.readLMR()
+    def decide(self,LMR):
+        # 状態が変わったときだけ車輪のデューティを返す。書き込み不要ならNone
+        if LMR==self.LMR:
+            return None
+        self.LMR=LMR
+        return MOTOR_TABLE.get(LMR)
+    def act(self,duties):
+        if duties is not None:
+            PWM.setMotorModel(*duties)
+    def teardown(self):
+        for sensor in (IR01_sensor,IR02_sensor,IR03_sensor):
+            sensor.when_line=None
+            sensor.when_no_line=None
+        PWM.setMotorModel(0,0,0,0)
     def run(self):
-        while True:
-            self.LMR=0x00
-            if IR01_sensor.value == True:
-                self.LMR=(self.LMR | 4)
-            if R02_sensor.value == True:
-                self.LMR=(self.LMR | 2)
-            if IR03_sensor.value == True:
-                self.LMR=(self.LMR | 1)
-            if self.LMR==2:
-                PWM.setMotorModel(800,800,800,800)
-            elif self.LMR==4:
-                PWM.setMotorModel(-1500,-1500,2500,2500)
-            elif self.LMR==6:
-                PWM.setMotorModel(-2000,-2000,4000,4000)
-            elif self.LMR==1:
-                PWM.setMotorModel(2500,2500,-1500,-1500)
-            elif self.LMR==3:
-                PWM.setMotorModel(4000,4000,-2000,-2000)
-            elif self.LMR==7:
-                #pass
-                PWM.setMotorModel(0,0,0,0)
+        ControlLoop(self,self.rate).run()
             
 infrared=Line_Tracking()
 # Main program logic follows:
@@ -1,15 +1,17 @@
 # Motor.py
 import time
 import math
-from PCA9685 import PCA9685
+from Rotation import RotateEngine
+from I2CBus import getPCA9685
 from ADC import *
+from Battery import getBattery
 
 class Motor:
     def __init__(self):
-        self.pwm = PCA9685(0x40, debug=True)
-        self.pwm.setPWMFreq(1000)
-        self.time_proportion = 3  # 使用されていないようです
+        self.pwm = getPCA9685(0x40, 1000)  # サーボ使用時は50Hzに統一される
+        self.time_proportion = 3  # RotateEngineの1ステップ(5度)あたりの時間係数
         self.adc = Adc()
+        self.rotator = RotateEngine(self, self.time_proportion, self.bat_Compensate)
         self.left_motor_scaling = 0.7  # 左側モーターのスケーリングファクターを0.7に変更
         self.MIN_DUTY = 100  # モーターが動作する最低限のデューティサイクル
     
@@ -64,6 +66,17 @@ class Motor:
             self.pwm.setMotorPwm(4, 0)
             self.pwm.setMotorPwm(5, 0)
     
+    @staticmethod
+    def motor_Channels(duty1, duty2, duty3, duty4):
+        # チャンネル0〜7のOFF値（上の各ホイールメソッドと同じ割り当て）
+        channels = [0] * 8
+        for duty, forward, backward in ((duty1, 1, 0), (duty2, 2, 3), (duty3, 7, 6), (duty4, 5, 4)):
+            if duty > 0:
+                channels[forward] = duty
+            elif duty < 0:
+                channels[backward] = abs(duty)
+        return channels
+
     def setMotorModel(self, duty1, duty2, duty3, duty4, turning=False):
         duty1, duty2, duty3, duty4 = self.duty_range(duty1, duty2, duty3, duty4)
         if turning:
@@ -78,11 +91,12 @@ class Motor:
         duty1 = duty1 if abs(duty1) > self.MIN_DUTY else 0
         duty2 = duty2 if abs(duty2) > self.MIN_DUTY else 0
         
-        self.left_Upper_Wheel(duty1)
-        self.left_Lower_Wheel(duty2)
-        self.right_Upper_Wheel(duty3)
-        self.right_Lower_Wheel(duty4)
+        # 8チャンネル分をまとめて1回のブロック書き込みで送信
+        self.pwm.setMotorPwms(0, self.motor_Channels(duty1, duty2, duty3, duty4))
     
+    def bat_Compensate(self):
+        return getBattery(self.adc).compensation(7.5)
+
     def Rotate(self, direction, speed=2000):
         """
         direction: 'left' または 'right'
@@ -100,3 +114,7 @@ class Motor:
     
     def stop(self):
         self.setMotorModel(0, 0, 0, 0)
+
+    def emergencyStop(self):
+        # ALL_LEDレジスタへの1回の書き込みで全出力（サーボを含む）を0にする
+        self.pwm.setAllPWM(0, 0)
@@ -2,6 +2,7 @@
 
 import time
 import math
+import threading
 import smbus
 
 # ============================================================================
@@ -24,17 +25,60 @@ class PCA9685:
   __ALLLED_ON_H        = 0xFB
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
+  __MODE1_AI           = 0x20
+  __LED15_OFF_H        = 0x45
 
-  def __init__(self, address=0x40, debug=False):
-    self.bus = smbus.SMBus(1)
+  def __init__(self, address=0x40, debug=False, auto_increment=False, bus=None):
+    self.bus = bus if bus is not None else smbus.SMBus(1)
+    self.lock = threading.RLock()
     self.address = address
     self.debug = debug
-    self.write(self.__MODE1, 0x00)
+    self.auto_increment = auto_increment
+    self.shadow = {}          # LEDn register -> last value written
+    self.cache_hits = 0
+    self.cache_misses = 0
+    if auto_increment:
+      self.write(self.__MODE1, self.__MODE1_AI)
+    else:
+      self.write(self.__MODE1, 0x00)
     
   def write(self, reg, value):
     "Writes an 8-bit value to the specified register/address"
-    self.bus.write_byte_data(self.address, reg, value)
+    with self.lock:
+      shadowed = self.__LED0_ON_L <= reg <= self.__LED15_OFF_H
+      if shadowed:
+        if self.shadow.get(reg) == value:
+          self.cache_hits += 1
+          return
+        self.cache_misses += 1
+      # The shadow only records what the chip acknowledged, so a failed write is retried
+      self.bus.write_byte_data(self.address, reg, value)
+      if shadowed:
+        self.shadow[reg] = value
       
+  def writeBlock(self, reg, values):
+    "Writes consecutive registers starting at reg in one transaction (needs auto-increment)"
+    with self.lock:
+      changed = [i for i, value in enumerate(values) if self.shadow.get(reg+i) != value]
+      if not changed:
+        self.cache_hits += len(values)
+        return
+      first, last = changed[0], changed[-1]
+      self.cache_hits += len(values) - (last - first + 1)
+      self.cache_misses += last - first + 1
+      self.bus.write_i2c_block_data(self.address, reg+first, values[first:last+1])
+      for i in range(first, last + 1):
+        self.shadow[reg+i] = values[i]
+
+  def invalidate(self):
+    "Forgets the shadowed LEDn registers, e.g. after the chip has been reset"
+    with self.lock:
+      self.shadow.clear()
+
+  def cacheStats(self):
+    "Returns the shadow cache hit/miss counters (in registers)"
+    return {'hits': self.cache_hits, 'misses': self.cache_misses}
+
   def read(self, reg):
     "Read an unsigned byte from the I2C device"
     result = self.bus.read_byte_data(self.address, reg)
@@ -49,22 +93,56 @@ class PCA9685:
     prescale = math.floor(prescaleval + 0.5)
 
 
-    oldmode = self.read(self.__MODE1);
-    newmode = (oldmode & 0x7F) | 0x10        # sleep
-    self.write(self.__MODE1, newmode)        # go to sleep
-    self.write(self.__PRESCALE, int(math.floor(prescale)))
-    self.write(self.__MODE1, oldmode)
-    time.sleep(0.005)
-    self.write(self.__MODE1, oldmode | 0x80)
+    with self.lock:
+      oldmode = self.read(self.__MODE1);
+      newmode = (oldmode & 0x7F) | 0x10        # sleep
+      self.write(self.__MODE1, newmode)        # go to sleep
+      self.write(self.__PRESCALE, int(math.floor(prescale)))
+      self.write(self.__MODE1, oldmode)
+      time.sleep(0.005)
+      self.write(self.__MODE1, oldmode | 0x80)
 
   def setPWM(self, channel, on, off):
     "Sets a single PWM channel"
-    self.write(self.__LED0_ON_L+4*channel, on & 0xFF)
-    self.write(self.__LED0_ON_H+4*channel, on >> 8)
-    self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
-    self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+    if self.auto_increment:
+      self.writeBlock(self.__LED0_ON_L+4*channel, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+      return
+    with self.lock:
+      self.write(self.__LED0_ON_L+4*channel, on & 0xFF)
+      self.write(self.__LED0_ON_H+4*channel, on >> 8)
+      self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
+      self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+  def setAllPWM(self, on, off):
+    "Sets all 16 channels at once through the ALL_LED registers"
+    values = [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+    with self.lock:
+      try:
+        if self.auto_increment:
+          self.bus.write_i2c_block_data(self.address, self.__ALLLED_ON_L, values)
+        else:
+          for i, value in enumerate(values):
+            self.bus.write_byte_data(self.address, self.__ALLLED_ON_L+i, value)
+      except OSError:
+        # Some LEDn registers may have changed, the shadow no longer matches the chip
+        self.shadow.clear()
+        raise
+      # ALL_LED writes land in every LEDn register, resync the shadow to match
+      for channel in range(16):
+        for i, value in enumerate(values):
+          self.shadow[self.__LED0_ON_L+4*channel+i] = value
   def setMotorPwm(self,channel,duty):
     self.setPWM(channel,0,duty)
+  def setMotorPwms(self, channel, duties):
+    "Sets consecutive PWM channels starting at channel in one block write"
+    if not self.auto_increment:
+      for i, duty in enumerate(duties):
+        self.setMotorPwm(channel+i, duty)
+      return
+    values = []
+    for duty in duties:
+      duty = int(duty)
+      values += [0, 0, duty & 0xFF, duty >> 8]
+    self.writeBlock(self.__LED0_ON_L+4*channel, values)
   def setServoPulse(self, channel, pulse):
     "Sets the Servo Pulse,The PWM frequency must be 50HZ"
     pulse = pulse*4096/20000        #PWM frequency is 50HZ,the period is 20000us
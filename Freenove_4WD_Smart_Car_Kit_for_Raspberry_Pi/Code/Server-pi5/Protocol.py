@@ -0,0 +1,186 @@
+import struct
+import time
+from Command import COMMAND as cmd
+
+# ============================================================================
+# Binary command framing, accepted on the command port next to the text
+# protocol ("CMD_X#a#b\n").
+# A frame is a 4 byte header, magic, version, command id and payload
+# length, followed by the struct-packed fields of that command. The magic
+# byte 0xA5 never starts a text line (it is not valid leading UTF-8), so
+# both kinds can be mixed on one connection.
+# ============================================================================
+
+MAGIC = 0xA5
+VERSION = 1
+HEADER = struct.Struct('<BBBB')
+
+# command name -> (id, payload format)
+COMMANDS = {
+    cmd.CMD_MOTOR: (0x01, '<4h'),          # FL, BL, FR, BR duties
+    cmd.CMD_M_MOTOR: (0x02, '<4h'),        # heading, speed, turn heading, turn speed
+    cmd.CMD_CAR_ROTATE: (0x03, '<4h'),     # heading, speed, start angle, rotate flag
+    cmd.CMD_SERVO: (0x04, '<Bh'),          # channel, angle
+    cmd.CMD_LED: (0x05, '<4B'),            # led mask, red, green, blue
+    cmd.CMD_LED_MOD: (0x06, '<B'),
+    cmd.CMD_BUZZER: (0x07, '<B'),
+    cmd.CMD_SONIC: (0x08, '<B'),
+    cmd.CMD_LIGHT: (0x09, '<B'),
+    cmd.CMD_POWER: (0x0A, ''),
+    cmd.CMD_MODE: (0x0B, '<B'),
+}
+BY_ID = dict((cid, (name, struct.Struct(fmt))) for name, (cid, fmt) in COMMANDS.items())
+STRUCTS = dict((name, struct.Struct(fmt)) for name, (cid, fmt) in COMMANDS.items())
+
+# Commands that may go over the UDP control channel, where only the newest one matters
+CONTROL_COMMANDS = (cmd.CMD_MOTOR, cmd.CMD_M_MOTOR, cmd.CMD_CAR_ROTATE, cmd.CMD_SERVO)
+
+# UDP control datagram header: sequence number, sender timestamp in ms
+DATAGRAM = struct.Struct('<IQ')
+
+# CMD_MODE is sent by name by the client, the server also accepts these numbers
+MODE_IDS = {'one': 0, 'two': 1, 'three': 3, 'four': 2}
+
+
+def encode(name, *fields):
+    "One binary frame for a command and its integer fields"
+    cid = COMMANDS[name][0]
+    payload = STRUCTS[name].pack(*fields)
+    return HEADER.pack(MAGIC, VERSION, cid, len(payload)) + payload
+
+
+def encodeLine(line):
+    """Binary frames for text commands ("CMD_X#a#b\\n", several lines allowed).
+    Commands without a binary form, or whose fields do not fit, stay text."""
+    out = []
+    for text in line.split('\n'):
+        if not text:
+            continue
+        data = text.split('#')
+        name = data[0]
+        if name in COMMANDS:
+            try:
+                fields = data[1:]
+                if name == cmd.CMD_MODE:
+                    fields = [MODE_IDS.get(field, field) for field in fields]
+                out.append(encode(name, *[int(field) for field in fields]))
+                continue
+            except (ValueError, struct.error):
+                pass
+        out.append((text + '\n').encode('utf-8'))
+    return b''.join(out)
+
+
+class StreamDecoder:
+    """Splits a byte stream of mixed text lines and binary frames into commands.
+
+    feed() returns every complete command as a list of strings, the same
+    shape as a text line split on '#', and keeps any partial tail for the
+    next call.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.lines = 0
+        self.errors = 0
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        commands = []
+        pos = 0
+        while pos < len(buf):
+            if buf[pos] == MAGIC:
+                if len(buf) - pos < HEADER.size:
+                    break
+                magic, version, cid, length = HEADER.unpack_from(buf, pos)
+                end = pos + HEADER.size + length
+                if end > len(buf):
+                    break
+                entry = BY_ID.get(cid)
+                if version != VERSION or entry is None or entry[1].size != length:
+                    self.errors += 1
+                else:
+                    name, fields = entry
+                    commands.append([name] + [str(field) for field in fields.unpack_from(buf, pos + HEADER.size)])
+                    self.frames += 1
+                pos = end
+            else:
+                end = buf.find(b'\n', pos)
+                if end < 0:
+                    break
+                text = bytes(buf[pos:end]).decode('utf-8', 'replace')
+                if text:
+                    commands.append(text.split('#'))
+                    self.lines += 1
+                pos = end + 1
+        del buf[:pos]
+        return commands
+
+
+def encodeDatagram(seq, line, stamp=None):
+    "One UDP control datagram carrying the commands of `line`"
+    if stamp is None:
+        stamp = int(time.monotonic() * 1000)
+    return DATAGRAM.pack(seq & 0xFFFFFFFF, stamp) + encodeLine(line)
+
+
+class DatagramFilter:
+    """Accepts the UDP control datagrams of one sender, newest first.
+
+    A datagram whose sequence number is not newer than the last accepted
+    one is dropped as reordered (or duplicated). A datagram older than
+    max_age seconds is dropped as stale. The sender's clock is not synced
+    to ours, so the age is measured against the shortest recent transit.
+    That baseline rises by at most `drift` (ms per ms) between datagrams
+    and drops to any shorter transit, so it follows a sender clock that
+    runs slow without letting a sudden delay through. Gaps in the
+    sequence are counted as lost.
+    """
+    def __init__(self, max_age=0.2, drift=0.001):
+        self.max_age = max_age
+        self.drift = drift
+        self.last = None
+        self.offset = None      # shortest recent (arrival - sender stamp), unit: ms
+        self.arrived = None     # arrival time of the last offset update, unit: ms
+        self.received = 0
+        self.accepted = 0
+        self.lost = 0
+        self.reordered = 0
+        self.stale = 0
+        self.errors = 0
+
+    def feed(self, data, now=None):
+        "The commands of one datagram, or [] if it is malformed, out of order or too old"
+        if len(data) < DATAGRAM.size:
+            self.errors += 1
+            return []
+        self.received += 1
+        seq, stamp = DATAGRAM.unpack_from(data)
+        if self.last is not None:
+            gap = (seq - self.last) & 0xFFFFFFFF
+            if gap == 0 or gap >= 0x80000000:
+                self.reordered += 1
+                return []
+            self.lost += gap - 1
+        self.last = seq
+        if now is None:
+            now = int(time.monotonic() * 1000)
+        transit = now - stamp
+        if self.offset is None:
+            self.offset = transit
+        else:
+            self.offset = min(transit, self.offset + (now - self.arrived) * self.drift)
+        self.arrived = now
+        if transit - self.offset > self.max_age * 1000:
+            self.stale += 1
+            return []
+        decoder = StreamDecoder()
+        commands = decoder.feed(bytes(data[DATAGRAM.size:]))
+        self.errors += decoder.errors
+        self.accepted += 1
+        return commands
+
+    def stats(self):
+        return {'received': self.received, 'accepted': self.accepted, 'lost': self.lost,
+                'reordered': self.reordered, 'stale': self.stale, 'errors': self.errors}
@@ -0,0 +1,86 @@
+import threading
+import time
+import Mecanum
+
+
+class RotateEngine:
+    """Spins the car in place while keeping its travel heading.
+
+    Steps are scheduled against time.monotonic() deadlines and the heading
+    is derived from the elapsed time, so the rotation rate stays right even
+    when a step runs late. A run ends after `target` degrees, after
+    `duration` seconds, or on stop().
+    """
+    def __init__(self, motor, time_proportion=2.5, compensate=None, step=5, speed=2000):
+        self.motor = motor
+        self.time_proportion = time_proportion
+        self.compensate = compensate      # returns the battery compensation factor
+        self.step = step                  # degrees per step
+        self.speed = speed
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.resetStats()
+
+    def resetStats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+
+    def stats(self):
+        return {'ticks': self.ticks, 'overruns': self.overruns,
+                'jitter_mean': self.jitter_total / self.ticks if self.ticks else 0.0,
+                'jitter_max': self.jitter_max}
+
+    def run(self, angle=0, target=None, duration=None):
+        "Rotates in the calling thread until done or stopped"
+        self.stop_event.clear()
+        self.rotate(angle, target, duration)
+
+    def rotate(self, angle, target, duration):
+        self.resetStats()
+        bat_compensate = self.compensate() if self.compensate else 1.0
+        period = self.step * self.time_proportion * bat_compensate / 1000
+        rate = self.step / period         # degrees per second
+        start = time.monotonic()
+        deadline = start
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                elapsed = now - start
+                turned = rate * elapsed
+                if duration is not None and elapsed >= duration:
+                    break
+                if target is not None and turned >= abs(target):
+                    break
+                lateness = now - deadline
+                self.ticks += 1
+                self.jitter_total += lateness
+                self.jitter_max = max(self.jitter_max, lateness)
+                VX, VY = Mecanum.polar(angle - turned, self.speed)
+                FL, BL, FR, BR = Mecanum.wheels(VX, VY, self.speed)
+                self.motor.setMotorModel(FL, BL, FR, BR)
+                deadline += period
+                if deadline < time.monotonic():
+                    # Missed whole steps, resume on the next slot instead of bursting
+                    self.overruns += 1
+                    deadline = start + (int((time.monotonic() - start) / period) + 1) * period
+                self.stop_event.wait(max(0.0, deadline - time.monotonic()))
+        finally:
+            self.motor.setMotorModel(0, 0, 0, 0)
+
+    def start(self, angle=0, target=None, duration=None):
+        "Rotates in a background thread, replacing any rotation in progress"
+        self.stop()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.rotate, args=(angle, target, duration), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
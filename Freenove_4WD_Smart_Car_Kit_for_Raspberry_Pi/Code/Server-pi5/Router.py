@@ -0,0 +1,115 @@
+import time
+
+
+class Route:
+    "One registered command: its handler, argument parsers and counters"
+    def __init__(self, handler, parsers, guard, key):
+        self.handler = handler
+        self.parsers = parsers
+        self.guard = guard
+        self.key = key
+        self.calls = 0
+        self.errors = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class CommandRouter:
+    """Dispatches decoded commands ([name, field, ...]) to handlers by name.
+
+    A handler is registered with one parser per field (int, str, ...).
+    The fields are parsed before the handler runs, and a command with
+    missing or malformed fields is counted as an error and dropped. The
+    optional guard is checked before the call, e.g. to accept motor
+    commands only in manual mode. Every route keeps its own call count
+    and handler latency for stats().
+
+    Routes registered with a key take part in coalescing in
+    dispatchBatch(): of the commands in one batch that share a key, only
+    the newest is run, at its own place in the batch. The key is a string
+    or a function of the parsed arguments (e.g. one key per servo
+    channel). Commands without a key always run, in order.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.unknown = 0
+        self.coalesced = 0
+
+    def register(self, name, handler, *parsers, guard=None, key=None):
+        self.routes[name] = Route(handler, parsers, guard, key)
+
+    def parse(self, data):
+        "The route and parsed arguments for a command, or (route, None) if it is rejected"
+        route = self.routes.get(data[0])
+        if route is None:
+            self.unknown += 1
+            return None, None
+        if len(data) - 1 < len(route.parsers):
+            route.errors += 1
+            return route, None
+        try:
+            args = [parser(field) for parser, field in zip(route.parsers, data[1:])]
+        except ValueError:
+            route.errors += 1
+            return route, None
+        return route, args
+
+    def call(self, route, args):
+        if route.guard is not None and not route.guard():
+            route.skipped += 1
+            return False
+        start = time.perf_counter()
+        try:
+            route.handler(*args)
+        except Exception as e:
+            route.errors += 1
+            print('Command ' + route.handler.__name__ + ' failed: ' + str(e))
+        elapsed = time.perf_counter() - start
+        route.calls += 1
+        route.total += elapsed
+        route.max = max(route.max, elapsed)
+        return True
+
+    def dispatch(self, data):
+        "Parses and runs one command, returns True if a handler was called"
+        if not data or not data[0]:
+            return False
+        route, args = self.parse(data)
+        if args is None:
+            return False
+        return self.call(route, args)
+
+    def dispatchBatch(self, commands):
+        "Runs the commands of one recv batch, skipping those superseded by a newer one with the same key"
+        parsed = []
+        for data in commands:
+            if not data or not data[0]:
+                continue
+            route, args = self.parse(data)
+            if args is None:
+                continue
+            key = route.key(*args) if callable(route.key) else route.key
+            parsed.append((route, args, key))
+        newest = {}
+        for index, (route, args, key) in enumerate(parsed):
+            if key is not None:
+                newest[key] = index
+        called = 0
+        for index, (route, args, key) in enumerate(parsed):
+            if key is not None and newest[key] != index:
+                route.coalesced += 1
+                self.coalesced += 1
+                continue
+            if self.call(route, args):
+                called += 1
+        return called
+
+    def stats(self):
+        stats = {}
+        for name, route in self.routes.items():
+            stats[name] = {'calls': route.calls, 'errors': route.errors, 'skipped': route.skipped,
+                           'coalesced': route.coalesced,
+                           'mean': route.total / route.calls if route.calls else 0.0, 'max': route.max}
+        return stats
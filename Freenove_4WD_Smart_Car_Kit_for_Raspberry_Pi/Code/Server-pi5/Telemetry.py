@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class Telemetry:
+    """Schedules the sensor readings published to the clients.
+
+    Each enabled stream has a sampler returning one protocol line and its
+    own period. sample() samples every stream that is due, joins the
+    lines into a single send() call, and returns the time the next stream
+    is due. That way readings from one moment arrive together and never
+    interleave with another writer. The caller owns the timing, which is
+    ServerCore.telemetry() on the server's event loop. If the send fails,
+    the streams in that batch are disabled, like the old per-sensor timers
+    did.
+    """
+    def __init__(self, send):
+        self.send = send
+        self.lock = threading.Lock()
+        self.streams = {}       # name -> [sampler, period, next due time]
+        self.batches = 0
+        self.lines = 0
+
+    def enable(self, name, sampler, period, delay=0.0):
+        with self.lock:
+            self.streams[name] = [sampler, period, time.monotonic() + delay]
+
+    def disable(self, name):
+        with self.lock:
+            self.streams.pop(name, None)
+
+    def enabled(self, name):
+        with self.lock:
+            return name in self.streams
+
+    def sample(self):
+        "Samples the due streams and sends them, returns the time of the next due stream or None"
+        now = time.monotonic()
+        with self.lock:
+            due = [(name, stream) for name, stream in self.streams.items() if stream[2] <= now]
+            for name, stream in due:
+                stream[2] = max(stream[2] + stream[1], now)
+        lines = []
+        for name, stream in due:
+            try:
+                lines.append(stream[0]())
+            except Exception as e:
+                print('Telemetry ' + name + ' failed: ' + str(e))
+        if lines:
+            try:
+                self.send(''.join(lines))
+                self.batches += 1
+                self.lines += len(lines)
+            except Exception:
+                for name, stream in due:
+                    self.disable(name)
+        with self.lock:
+            if not self.streams:
+                return None
+            return min(stream[2] for stream in self.streams.values())
@@ -3,74 +3,94 @@ from Motor import *
 from gpiozero import DistanceSensor
 from servo import *
 from PCA9685 import PCA9685
+from Scanner import Scanner
+from ControlLoop import ControlLoop
 trigger_pin = 27
 echo_pin    = 22
-sensor = DistanceSensor(echo=echo_pin, trigger=trigger_pin ,max_distance=3)
+median_window = 5   # 距離の中央値をとるサンプル数
+sample_wait = 0.06  # DistanceSensorの計測間隔(gpiozeroの既定値)
+# gpiozeroがエコーのエッジ割り込みで計測し、queue_len個の中央値を保持する。partial=Trueで起動直後から読める
+sensor = DistanceSensor(echo=echo_pin, trigger=trigger_pin ,max_distance=3,queue_len=median_window,partial=True)
 class Ultrasonic:
     def __init__(self):        
-        pass
+        self.loop_rate=20   # 障害物回避の1秒あたりのティック数
+        self.sector_age=3.5 # これより古いセクタの値は無いものとする(約2往復分)、単位: 秒
+        self.reverse_time=0.1   # 旋回の前に後退する時間、単位: 秒
+        self.pending=None   # 後退の後に続く旋回の(デューティ, 時刻)
+        self.decided=0.0    # 最後に判断に使ったスキャナの時刻
     def get_distance(self):     # get the measurement results of ultrasonic module,with unit: cm
         distance_cm = sensor.distance * 100
         return  int(distance_cm)
+    def measure(self):          # サーボ移動後の新しい距離、単位: cm (値が無ければNone)
+        # gpiozeroの公開APIは中央値(distance)だけなので、窓の過半数がサーボ停止後のサンプルに入れ替わるまで待つ。
+        # 1か所あたり約0.18秒かかるため、Scanner側は角度の刻みを粗くしている(setup()を参照)
+        time.sleep((median_window//2+1)*sample_wait)
+        distance=sensor.distance
+        return None if distance is None else int(distance*100)
     
-    def run_motor(self,L,M,R):
+    def choose(self,L,M,R):     # センサの距離に対するデューティと、reverse_time後に切り替えるデューティ(無ければNone)
         if (L < 30 and M < 30 and R <30) or M < 30 :
-            self.PWM.setMotorModel(-1450,-1450,-1450,-1450) 
-            time.sleep(0.1)   
             if L < R:
-                self.PWM.setMotorModel(1450,1450,-1450,-1450)
-            else :
-                self.PWM.setMotorModel(-1450,-1450,1450,1450)
+                return (-1450,-1450,-1450,-1450),(1450,1450,-1450,-1450)
+            return (-1450,-1450,-1450,-1450),(-1450,-1450,1450,1450)
         elif L < 30 and M < 30:
-            PWM.setMotorModel(1500,1500,-1500,-1500)
+            return (1500,1500,-1500,-1500),None
         elif R < 30 and M < 30:
-            PWM.setMotorModel(-1500,-1500,1500,1500)
+            return (-1500,-1500,1500,1500),None
         elif L < 20 :
-            PWM.setMotorModel(2000,2000,-500,-500)
             if L < 10 :
-                PWM.setMotorModel(1500,1500,-1000,-1000)
+                return (1500,1500,-1000,-1000),None
+            return (2000,2000,-500,-500),None
         elif R < 20 :
-            PWM.setMotorModel(-500,-500,2000,2000)
             if R < 10 :
-                PWM.setMotorModel(-1500,-1500,1500,1500)
-        else :
-            self.PWM.setMotorModel(600,600,600,600)
+                return (-1500,-1500,1500,1500),None
+            return (-500,-500,2000,2000),None
+        return (600,600,600,600),None
+    def run_motor(self,L,M,R):
+        duties,then=self.choose(L,M,R)
+        self.PWM.setMotorModel(*duties)
+        self.pending=None if then is None else (then,time.monotonic()+self.reverse_time)   # 後退の後の旋回はdecide()で書く
                 
-    def run(self):
+    def setup(self):
         self.PWM=Motor()
         self.pwm_S=Servo()
-        for i in range(30,151,60):
-                self.pwm_S.setServoPwm('0',i)
-                time.sleep(0.2)
-                if i==30:
-                    L = self.get_distance()
-                elif i==90:
-                    M = self.get_distance()
-                else:
-                    R = self.get_distance()
-        while True:
-            for i in range(90,30,-60):
-                self.pwm_S.setServoPwm('0',i)
-                time.sleep(0.2)
-                if i==30:
-                    L = self.get_distance()
-                elif i==90:
-                    M = self.get_distance()
-                else:
-                    R = self.get_distance()
-                self.run_motor(L,M,R)
-            for i in range(30,151,60):
-                self.pwm_S.setServoPwm('0',i)
-                time.sleep(0.2)
-                if i==30:
-                    L = self.get_distance()
-                elif i==90:
-                    M = self.get_distance()
-                else:
-                    R = self.get_distance()
-                self.run_motor(L,M,R)
-        
-            
+        self.scanner=Scanner(self.pwm_S,self,resolution=20)    # measure()が遅いので7か所、1往復約1.5秒
+        self.scanner.start()
+        self.pending=None
+        self.decided=0.0
+    def sense(self):
+        if not self.scanner.ready.is_set():
+            return None     # 最初の1往復が終わるまで待つ
+        age=self.sector_age
+        return self.scanner.sector(30,60,age),self.scanner.sector(70,110,age),self.scanner.sector(120,150,age),self.scanner.stamps.max()
+    def decide(self,reading):   # このティックで書くデューティ。Noneなら今のまま
+        if self.pending is not None:
+            then,until=self.pending
+            if time.monotonic()<until:
+                return None
+            self.pending=None
+            return then
+        if reading is None:
+            return None
+        L,M,R,stamp=reading
+        if stamp<=self.decided:
+            return None     # 前回の判断から新しい値が無い
+        self.decided=stamp
+        if L!=L or M!=M or R!=R:
+            return (0,0,0,0)    # 新しい値の無いセクタ(NaN)がある。スキャナが止まっている
+        duties,then=self.choose(L,M,R)
+        if then is not None:
+            self.pending=(then,time.monotonic()+self.reverse_time)
+        return duties
+    def act(self,duties):
+        if duties is not None:
+            self.PWM.setMotorModel(*duties)
+    def teardown(self):
+        self.scanner.stop()
+        self.PWM.setMotorModel(0,0,0,0)
+        self.pwm_S.setServoPwm('0',90)
+    def run(self):
+        ControlLoop(self,self.loop_rate).run()
         
 ultrasonic=Ultrasonic()              
 # Main program logic follows:
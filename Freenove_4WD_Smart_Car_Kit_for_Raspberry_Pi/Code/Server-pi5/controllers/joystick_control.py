@@ -3,6 +3,8 @@ import time
 import sys
 import pygame
 from Motor import Motor
+from Ramp import MotorRamp
+import Mecanum
 from servo import Servo
 import logging
 import os
@@ -56,6 +58,7 @@ def joystick_control(audio_queue):
     """
     SERVO_NECK_CHANNEL = '1'  # サーボチャンネルを関数の先頭で初期化
     motor = None
+    ramp = None
     servo = None
     buzzer = None
 
@@ -63,6 +66,9 @@ def joystick_control(audio_queue):
         # ハードウェアコンポーネントの初期化
         motor = Motor()
         servo = Servo()
+        # 加速度制限付きで一定周期ごとにモーターへ書き込む
+        ramp = MotorRamp(motor)
+        ramp.start()
 
         # Pygameの初期化
         pygame.init()
@@ -171,17 +177,10 @@ def joystick_control(audio_queue):
                 duty_turn = int(turn * MAX_PWM)
 
                 # メカナムホイール用のPWM値の計算（全方向移動をサポート）
-                # 左右移動と旋回が連動するように計算
-                duty_front_left = duty_y + duty_x + duty_turn
-                duty_front_right = duty_y - duty_x - duty_turn
-                duty_back_left = duty_y - duty_x + duty_turn
-                duty_back_right = duty_y + duty_x - duty_turn
-
-                # PWM値を制限（-4095～4095）
-                duty_front_left = max(min(duty_front_left, MAX_PWM), -MAX_PWM)
-                duty_front_right = max(min(duty_front_right, MAX_PWM), -MAX_PWM)
-                duty_back_left = max(min(duty_back_left, MAX_PWM), -MAX_PWM)
-                duty_back_right = max(min(duty_back_right, MAX_PWM), -MAX_PWM)
+                # 右スティックは右旋回が正、Mecanumは左旋回が正なので符号を反転
+                # PWM値は-4095～4095に制限
+                duty_front_left, duty_back_left, duty_front_right, duty_back_right = \
+                    Mecanum.wheels(duty_x, duty_y, -duty_turn, limit=MAX_PWM)
 
                 # PWM値をログに表示（デバッグ用）
                 logging.debug(f"PWM values - FL: {duty_front_left}, FR: {duty_front_right}, BL: {duty_back_left}, BR: {duty_back_right}")
@@ -189,8 +188,8 @@ def joystick_control(audio_queue):
                 # 旋回中かどうかを判定
                 is_turning = (turn != 0)
 
-                # モーターにPWM値を送信
-                motor.setMotorModel(duty_front_left, duty_back_left, duty_front_right, duty_back_right, turning=is_turning)
+                # モーターの目標PWM値を更新（実際の書き込みはランプ側で行う）
+                ramp.setMotorModel(duty_front_left, duty_back_left, duty_front_right, duty_back_right, turning=is_turning)
 
                 # デバッグログの強化（スケーリング後のPWM値を表示）
                 logging.debug(f"Scaled PWM values - FL: {int(duty_front_left * motor.left_motor_scaling * (0.7 if is_turning else 0.8))}, "
@@ -217,8 +216,8 @@ def joystick_control(audio_queue):
 
             except IOError as e:
                 logging.error(f"I/O error occurred: {e}. Attempting to continue.")
-                if motor:
-                    motor.setMotorModel(0, 0, 0, 0)
+                if ramp:
+                    ramp.halt()
                 if servo:
                     servo.setServoPwm(SERVO_NECK_CHANNEL, SERVO_NECK_NEUTRAL)
                 time.sleep(1)  # 再試行前に待機
@@ -232,6 +231,8 @@ def joystick_control(audio_queue):
         logging.error(f"An error occurred: {e}")
     finally:
         try:
+            if ramp:
+                ramp.stop()
             if motor:
                 # モーターを停止
                 motor.setMotorModel(0, 0, 0, 0)
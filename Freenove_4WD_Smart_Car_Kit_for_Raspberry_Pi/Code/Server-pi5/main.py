@@ -8,6 +8,7 @@ import sys,getopt
 from Thread import *
 from threading import Thread
 from server import Server
+from AsyncCore import ServerCore
 from server_ui import Ui_server_ui
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import *
@@ -21,6 +22,7 @@ class mywindow(QMainWindow,Ui_server_ui):
         self.user_ui=True
         self.start_tcp=False
         self.TCP_Server=Server()
+        self.core=None
         self.parseOpt()
         if self.user_ui:
             self.app = QApplication(sys.argv)
@@ -36,13 +38,8 @@ class mywindow(QMainWindow,Ui_server_ui):
             self.pushButton_Min.clicked.connect(self.windowMinimumed)
         
         if self.start_tcp:
-            self.TCP_Server.StartTcpServer()
-            self.ReadData=Thread(target=self.TCP_Server.readdata)
-            self.SendVideo=Thread(target=self.TCP_Server.sendvideo)
-            self.power=Thread(target=self.TCP_Server.Power)
-            self.SendVideo.start()
-            self.ReadData.start()
-            self.power.start()
+            self.core=ServerCore(self.TCP_Server)
+            self.core.start()
             if self.user_ui:
                 self.label.setText("Server On")
                 self.Button_Server.setText("Off")
@@ -73,19 +70,9 @@ class mywindow(QMainWindow,Ui_server_ui):
                 self.user_ui=False
                         
     def close(self):
-        try:
-           stop_thread(self.SendVideo)
-           stop_thread(self.ReadData)
-           stop_thread(self.power)
-        except:
-            pass
-        try:
-            self.TCP_Server.server_socket.shutdown(2)
-            self.TCP_Server.server_socket1.shutdown(2)
-            self.TCP_Server.StopTcpServer()
-        except:
-            pass
-        print ("Close TCP")
+        if self.core is not None:
+            self.core.stop()
+            self.core=None
         if self.user_ui:
             QCoreApplication.instance().quit()
         os._exit(0)
@@ -93,28 +80,15 @@ class mywindow(QMainWindow,Ui_server_ui):
         if self.label.text()=="Server Off":
             self.label.setText("Server On")
             self.Button_Server.setText("Off")
-            self.TCP_Server.tcp_Flag = True
             print ("Open TCP")
-            self.TCP_Server.StartTcpServer()
-            self.SendVideo=Thread(target=self.TCP_Server.sendvideo)
-            self.ReadData=Thread(target=self.TCP_Server.readdata)
-            self.power=Thread(target=self.TCP_Server.Power)
-            self.SendVideo.start()
-            self.ReadData.start()
-            self.power.start()
+            self.core=ServerCore(self.TCP_Server)
+            self.core.start()
             
         elif self.label.text()=='Server On':
             self.label.setText("Server Off")
             self.Button_Server.setText("On")
-            self.TCP_Server.tcp_Flag = False
-            try:
-                stop_thread(self.ReadData)
-                stop_thread(self.power)
-                stop_thread(self.SendVideo)
-            except:
-                pass
-            self.TCP_Server.StopTcpServer()
-            print ("Close TCP")
+            self.core.stop()
+            self.core=None
             
 if __name__ == '__main__':
     try:
@@ -1,9 +1,109 @@
-import smbus
+from I2CBus import getBus
 import time
+import os
+import json
+import threading
+from collections import deque
+from Filters import RunningMedian
+from FixedRate import FixedRate
+
+class AdcSampler(threading.Thread):
+    "Scans ADC channels in the background into small ring buffers"
+    def __init__(self,adc,channels=(0,1,2),rate=20,size=8,filters=None):
+        super(AdcSampler,self).__init__(name='AdcSampler',daemon=True)
+        self.adc=adc
+        self.channels=channels
+        self.period=1.0/rate
+        self.schedule=FixedRate(self.period)
+        self.history={}         # channel -> deque of (timestamp, filtered voltage)
+        self.filters={}         # channel -> streaming filter (Filters.py)
+        for channel in channels:
+            self.history[channel]=deque(maxlen=size)
+            self.filters[channel]=RunningMedian(5)
+        if filters:
+            self.filters.update(filters)
+        self.last_scan=None     # (timestamp, {channel: filtered voltage}) of the newest scan
+        self.scans=0
+        self.errors=0
+    def latest(self,channel):
+        history=self.history.get(channel)
+        if not history:
+            return None
+        return history[-1]
+    def setFilter(self,channel,filter):
+        if filter is not None:
+            filter.reset()
+        self.filters[channel]=filter
+    def scan(self):
+        try:
+            stamp,values=self.adc.scanADC(self.channels)
+        except OSError:
+            self.errors+=1
+            values={}
+        for channel,value in values.items():
+            if self.filters.get(channel) is not None:
+                value=round(self.filters[channel].update(value),2)
+                values[channel]=value
+            self.history[channel].append((stamp,value))
+        if values:
+            self.last_scan=(stamp,values)
+            self.scans+=1
+    def run(self):
+        self.schedule.run(self.scan)
+    def stop(self):
+        self.schedule.stop()
+
+# One sampler per process, shared by every Adc instance
+_sampler=None
+_sampler_lock=threading.Lock()
+
+# Chip detection result per I2C address, kept for the process and in a small cache file
+CHIP_CACHE_FILE=os.path.expanduser('~/.cache/freenove_adc_chip.json')
+_chip={}
+_chip_lock=threading.Lock()
+
+def detectChip(bus,address,force=False):
+    """Returns "PCF8591" or "ADS7830" for the ADC at address.
+    Only probes the bus when neither the process nor the cache file knows
+    the answer, or when force is set (e.g. after swapping the board)."""
+    key='0x%02x'%address
+    with _chip_lock:
+        if not force:
+            if address in _chip:
+                return _chip[address]
+            try:
+                with open(CHIP_CACHE_FILE) as f:
+                    cached=json.load(f).get(key)
+            except (OSError,ValueError):
+                cached=None
+            if cached in ("PCF8591","ADS7830"):
+                _chip[address]=cached
+                return cached
+        for i in range(3):
+            aa=bus.read_byte_data(address,0xf4)
+            if aa < 150:
+                index="PCF8591"
+            else:
+                index="ADS7830"
+        _chip[address]=index
+        try:
+            try:
+                with open(CHIP_CACHE_FILE) as f:
+                    saved=json.load(f)
+            except (OSError,ValueError):
+                saved={}
+            saved[key]=index
+            os.makedirs(os.path.dirname(CHIP_CACHE_FILE),exist_ok=True)
+            with open(CHIP_CACHE_FILE,'w') as f:
+                json.dump(saved,f)
+        except OSError:
+            pass
+        return index
+
 class Adc:
     def __init__(self):
         # Get I2C bus
-        self.bus = smbus.SMBus(1)
+        self.bus = getBus()
         
         # I2C address of the device
         self.ADDRESS            = 0x48
@@ -14,45 +114,94 @@ class Adc:
         # ADS7830 Command 
         self.ADS7830_CMD                        = 0x84 # Single-Ended Inputs
         
-        for i in range(3):
-            aa=self.bus.read_byte_data(self.ADDRESS,0xf4)
-            if aa < 150:
-                self.Index="PCF8591"
-            else:
-                self.Index="ADS7830" 
+        # Sampler readings older than this (seconds) are read from the bus again
+        self.max_age = 1.0
+        
+        # Bounded read cost: bus reads per PCF8591 value, and attempts to get two agreeing values
+        self.burst = 3
+        self.max_reads = 4
+        
+        self.Index=detectChip(self.bus,self.ADDRESS)
     def analogReadPCF8591(self,chn):#PCF8591 read ADC value,chn:0,1,2,3
-        value=[0,0,0,0,0,0,0,0,0]
-        for i in range(9):
-            value[i] = self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+chn)
-        value=sorted(value)
-        return value[4]   
+        median = RunningMedian(self.burst)
+        for i in range(self.burst):
+            value = median.update(self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+chn))
+        return value
         
     def analogWritePCF8591(self,value):#PCF8591 write DAC value
         self.bus.write_byte_data(self.ADDRESS,cmd,value)
         
     def recvPCF8591(self,channel):#PCF8591 write DAC value
-        while(1):
-            value1 = self.analogReadPCF8591(channel)   #read the ADC value of channel 0,1,2,
+        value1 = self.analogReadPCF8591(channel)   #read the ADC value of channel 0,1,2,
+        for i in range(self.max_reads):            #until two reads agree, at most max_reads more
             value2 = self.analogReadPCF8591(channel)
             if value1==value2:
                 break;
+            value1 = value2
         voltage = value1 / 256.0 * 3.3  #calculate the voltage value
         voltage = round(voltage,2)
         return voltage
     def recvADS7830(self,channel):
         """Select the Command data from the given provided value above"""
         COMMAND_SET = self.ADS7830_CMD | ((((channel<<2)|(channel>>1))&0x07)<<4)
-        self.bus.write_byte(self.ADDRESS,COMMAND_SET)
-        while(1):
+        with self.bus.lock:     # keep the command byte and its reads together
+            self.bus.write_byte(self.ADDRESS,COMMAND_SET)
             value1 = self.bus.read_byte(self.ADDRESS)
-            value2 = self.bus.read_byte(self.ADDRESS)
-            if value1==value2:
-                break;
+            for i in range(self.max_reads):        #until two reads agree, at most max_reads more
+                value2 = self.bus.read_byte(self.ADDRESS)
+                if value1==value2:
+                    break;
+                value1 = value2
         voltage = value1 / 255.0 * 3.3  #calculate the voltage value
         voltage = round(voltage,2)
         return voltage
         
+    def scanADC(self,channels=(0,1,2)):
+        """Reads several channels in one pipelined bus sequence.
+        Returns (timestamp, {channel: voltage}) with one timestamp for the whole scan."""
+        values={}
+        with self.bus.lock:
+            stamp=time.monotonic()
+            if self.Index=="PCF8591":
+                # auto-increment: the first byte is the previous conversion, then channel 0,1,2,3
+                data=self.bus.read_i2c_block_data(self.ADDRESS,self.PCF8591_CMD|0x04,max(channels)+2)
+                for channel in channels:
+                    values[channel]=round(data[channel+1] / 256.0 * 3.3,2)
+            else:
+                for channel in channels:
+                    # command byte plus two conversions in a single combined transaction
+                    COMMAND_SET = self.ADS7830_CMD | ((((channel<<2)|(channel>>1))&0x07)<<4)
+                    data=self.bus.read_i2c_block_data(self.ADDRESS,COMMAND_SET,2)
+                    values[channel]=round(data[1] / 255.0 * 3.3,2)
+        return stamp,values
+    def recvScan(self,channels=(0,1,2)):#consistent snapshot of several channels and its age
+        scan=None
+        if _sampler is not None:
+            scan=_sampler.last_scan
+        if scan is not None and all(channel in scan[1] for channel in channels):
+            age=time.monotonic()-scan[0]
+            if age<=self.max_age:
+                return dict((channel,scan[1][channel]) for channel in channels),age
+        return self.scanADC(channels)[1],0.0
+    def startSampler(self,rate=20,channels=(0,1,2),size=8,filters=None):
+        global _sampler
+        with _sampler_lock:
+            if _sampler is None or not _sampler.is_alive():
+                _sampler=AdcSampler(self,channels,rate,size,filters)
+                _sampler.start()
+        return _sampler
+    def recvADCWithAge(self,channel):#latest sampler value and its age in seconds
+        sample=None
+        if _sampler is not None:
+            sample=_sampler.latest(channel)
+        if sample is not None:
+            age=time.monotonic()-sample[0]
+            if age<=self.max_age:
+                return sample[1],age
+        return self.readADC(channel),0.0
     def recvADC(self,channel):
+        return self.recvADCWithAge(channel)[0]
+    def readADC(self,channel):#always reads the bus
         if self.Index=="PCF8591":
             data=self.recvPCF8591(channel)
         elif self.Index=="ADS7830":
@@ -0,0 +1,308 @@
+import asyncio
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Protocol
+from Command import COMMAND as cmd
+
+
+class Viewer:
+    "A video client with a one-frame slot, a newer frame replaces one not sent yet"
+    def __init__(self, writer, task):
+        self.writer = writer
+        self.task = task
+        self.packet = None
+        self.event = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, packet):
+        if self.packet is not None:
+            self.dropped += 1
+        self.packet = packet
+        self.event.set()
+
+
+class ControlProtocol(asyncio.DatagramProtocol):
+    "Hands the datagrams of the UDP control port to the ServerCore"
+    def __init__(self, core):
+        self.core = core
+
+    def datagram_received(self, data, addr):
+        self.core.control(data, addr)
+
+
+class ServerCore:
+    """Runs a Server's network side as tasks on one asyncio event loop.
+
+    The command port (5000), the video port (8000), the power report and
+    the telemetry streams are tasks on a loop in one background thread.
+    Work that may block runs in executors. Commands run on a single worker
+    so they stay in order. Sensor sampling has a worker of its own, and
+    camera start/stop and frame waits use the default pool. Every socket
+    write happens on the loop thread. stop() cancels the tasks, closes the
+    sockets, stops the camera and joins the thread.
+
+    Any number of clients may connect to both ports. The oldest command
+    connection holds the driving token. Only its commands are applied,
+    other clients may only send VIEWER_COMMANDS. Text sent through send()
+    goes to every command client, except one whose unsent backlog is
+    over max_backlog. The camera runs while at least one viewer is
+    connected. Each frame is packed once and offered to every viewer's
+    one-frame slot, so a slow viewer drops frames without holding up the
+    others. A new camera task first waits for the previous one to close
+    its camera. If the camera fails, the viewers are disconnected and the
+    next viewer tries again.
+
+    Motion and servo commands (Protocol.CONTROL_COMMANDS) may also arrive
+    as Protocol datagrams on the UDP control port (5001). They are only
+    taken from the driving client's host. A Protocol.DatagramFilter per
+    sender drops those that are out of order or older than max_age, so
+    a lost packet never holds back a newer one. Set control_port to None
+    to turn the channel off.
+    """
+    VIEWER_COMMANDS = (cmd.CMD_POWER,)
+
+    def __init__(self, server, host=None, command_port=5000, video_port=8000, power_period=3.0, idle=0.05,
+                 max_backlog=65536, control_port=5001, max_age=0.2):
+        self.server = server
+        self.host = host
+        self.command_port = command_port
+        self.video_port = video_port
+        self.control_port = control_port
+        self.max_age = max_age            # oldest control datagram still applied, unit: s
+        self.power_period = power_period
+        self.idle = idle                  # telemetry poll period while no stream is due
+        self.max_backlog = max_backlog    # bytes queued for a client before its telemetry is skipped
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.stopping = None
+        self.connections = []             # command clients, oldest first
+        self.driver = None                # the command client holding the driving token
+        self.viewers = set()
+        self.camera_task = None
+        self.camera_closing = None        # the last camera task cancelled, until its camera is closed
+        self.clients = set()              # connection tasks, cancelled on stop
+        self.frames = 0
+        self.skipped = 0
+        self.control_addr = None          # sender of the control datagrams
+        self.datagrams = None             # its Protocol.DatagramFilter
+        self.rejected = 0                 # datagrams from a host other than the driver's
+
+    def start(self):
+        "Runs the event loop in a background thread"
+        self.ready.clear()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name='ServerCore', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def send(self, data):
+        "Queues text for every command client, callable from any thread"
+        if not self.connections:
+            raise OSError('no client connected')
+        payload = data.encode('utf-8')
+        if threading.current_thread() is self.thread:
+            self.broadcast(payload)
+        else:
+            self.loop.call_soon_threadsafe(self.broadcast, payload)
+
+    def broadcast(self, payload):
+        for writer in self.connections:
+            if writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_backlog:
+                self.skipped += 1
+                continue
+            writer.write(payload)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.commands = ThreadPoolExecutor(1, 'Commands')
+        self.sampling = ThreadPoolExecutor(1, 'Sampling')
+        servers = []
+        tasks = []
+        transport = None
+        try:
+            host = self.host or self.server.get_interface_ip()
+            servers.append(await asyncio.start_server(self.handleCommand, host, self.command_port, reuse_port=True))
+            servers.append(await asyncio.start_server(self.handleVideo, host, self.video_port, reuse_port=True))
+            if self.control_port is not None:
+                transport, protocol = await self.loop.create_datagram_endpoint(
+                    lambda: ControlProtocol(self), local_addr=(host, self.control_port), reuse_port=True)
+            tasks.append(asyncio.create_task(self.power()))
+            tasks.append(asyncio.create_task(self.telemetry()))
+            self.server.core = self
+            print('Server address: ' + host)
+            self.ready.set()
+            await self.stopping.wait()
+        finally:
+            self.ready.set()
+            self.server.core = None
+            for server in servers:
+                server.close()
+            if transport is not None:
+                transport.close()
+            tasks.extend(self.clients)
+            for camera_task in (self.camera_task, self.camera_closing):
+                if camera_task is not None:
+                    tasks.append(camera_task)
+            self.camera_task = None
+            self.camera_closing = None
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for server in servers:
+                await server.wait_closed()
+            self.commands.shutdown(wait=True)
+            self.sampling.shutdown(wait=True)
+            print('Close TCP')
+
+    def track(self):
+        task = asyncio.current_task()
+        self.clients.add(task)
+        return task
+
+    async def handleCommand(self, reader, writer):
+        task = self.track()
+        self.connections.append(writer)
+        if self.driver is None:
+            self.driver = writer
+        print('Client connection successful !')
+        decoder = Protocol.StreamDecoder()
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                commands = decoder.feed(data)
+                if writer is not self.driver:
+                    commands = [command for command in commands if command[0] in self.VIEWER_COMMANDS]
+                if commands:
+                    await self.loop.run_in_executor(self.commands, self.server.router.dispatchBatch, commands)
+        except (OSError, asyncio.CancelledError):
+            # stop() cancels the connection tasks, that ends them like a disconnect
+            pass
+        finally:
+            self.connections.remove(writer)
+            writer.close()
+            self.clients.discard(task)
+            if writer is self.driver:
+                # Stop the car and hand the token to the oldest remaining client
+                self.driver = self.connections[0] if self.connections else None
+                await self.loop.run_in_executor(self.commands, self.server.Reset)
+
+    def control(self, data, addr):
+        driver = self.driver
+        if driver is None or driver.get_extra_info('peername')[0] != addr[0]:
+            self.rejected += 1
+            return
+        if addr != self.control_addr:
+            # A new sender (or a restarted client) starts its own sequence
+            self.control_addr = addr
+            self.datagrams = Protocol.DatagramFilter(self.max_age)
+        commands = [command for command in self.datagrams.feed(data) if command[0] in Protocol.CONTROL_COMMANDS]
+        if commands:
+            self.loop.run_in_executor(self.commands, self.server.router.dispatchBatch, commands)
+
+    def controlStats(self):
+        "Counters of the UDP control channel"
+        stats = self.datagrams.stats() if self.datagrams is not None else {}
+        stats['rejected'] = self.rejected
+        return stats
+
+    async def handleVideo(self, reader, writer):
+        task = self.track()
+        viewer = Viewer(writer, task)
+        self.viewers.add(viewer)
+        if self.camera_task is None or self.camera_task.done():
+            self.camera_task = asyncio.create_task(self.camera(self.camera_closing))
+        print('socket video connected ... ')
+        try:
+            while True:
+                await viewer.event.wait()
+                viewer.event.clear()
+                packet, viewer.packet = viewer.packet, None
+                writer.write(packet)
+                await writer.drain()
+                viewer.sent += 1
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            writer.close()
+            self.clients.discard(task)
+            if not self.viewers and self.camera_task is not None:
+                self.camera_task.cancel()
+                self.camera_closing = self.camera_task
+                self.camera_task = None
+            print('End transmit ... ')
+
+    async def camera(self, previous=None):
+        "Runs the camera and offers each frame, packed once, to every viewer"
+        camera = None
+        start = None
+        try:
+            if previous is not None:
+                # Picamera2 can only be opened once the previous instance is closed
+                await asyncio.wait([previous])
+            start = self.loop.run_in_executor(None, self.server.startCamera)
+            camera, output = await asyncio.shield(start)
+            while True:
+                frame = await self.loop.run_in_executor(None, output.wait, 1.0)
+                if frame is None:
+                    continue
+                packet = struct.pack('<I', len(frame)) + frame
+                self.frames += 1
+                for viewer in self.viewers:
+                    viewer.offer(packet)
+        except Exception as e:
+            print('Camera failed: ' + str(e))
+            # Let the next viewer start over once this camera is closed
+            self.camera_closing = asyncio.current_task()
+            self.camera_task = None
+            for viewer in self.viewers:
+                viewer.task.cancel()
+        finally:
+            if camera is None and start is not None:
+                # Cancelled while the camera was starting, close it once it is up
+                started = await self.settle(start)
+                camera = started[0] if started else None
+            if camera is not None:
+                await self.settle(self.loop.run_in_executor(None, self.server.stopCamera, camera))
+
+    async def settle(self, future):
+        "Waits for an executor future even through cancellation, returns its result or None if it failed"
+        while not future.done():
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                pass
+        if future.exception() is not None:
+            return None
+        return future.result()
+
+    async def power(self):
+        while True:
+            try:
+                line = await self.loop.run_in_executor(self.sampling, self.server.powerLine)
+                self.send(line)
+            except OSError:
+                pass
+            await asyncio.sleep(self.power_period)
+
+    async def telemetry(self):
+        telemetry = self.server.telemetry
+        while True:
+            next_due = await self.loop.run_in_executor(self.sampling, telemetry.sample)
+            delay = self.idle if next_due is None else next_due - time.monotonic()
+            await asyncio.sleep(min(max(delay, 0.0), self.idle))
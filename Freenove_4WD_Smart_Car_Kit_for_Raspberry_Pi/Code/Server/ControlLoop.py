@@ -0,0 +1,41 @@
+import threading
+from FixedRate import FixedRate
+
+
+class ControlLoop(threading.Thread):
+    """Runs a driving mode at a fixed tick rate.
+
+    Every tick calls mode.act(mode.decide(mode.sense())). The mode may also
+    define setup() and teardown(), run before the first tick and after the
+    last one (teardown also runs when a tick raises). Ticks follow a
+    FixedRate schedule. stop() ends the loop between ticks.
+    """
+    def __init__(self, mode, rate, name=None, window=1000):
+        super().__init__(name=name or type(mode).__name__, daemon=True)
+        self.mode = mode
+        self.schedule = FixedRate(1.0 / rate, window)
+
+    def tick(self):
+        self.mode.act(self.mode.decide(self.mode.sense()))
+
+    def run(self):
+        setup = getattr(self.mode, 'setup', None)
+        teardown = getattr(self.mode, 'teardown', None)
+        try:
+            if setup is not None:
+                setup()
+            self.schedule.run(self.tick)
+        finally:
+            if teardown is not None:
+                teardown()
+
+    def stats(self):
+        return self.schedule.stats()
+
+    def stop(self):
+        self.schedule.stop()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join()
+            stats = self.stats()
+            print('%s loop: %d ticks, %d overruns, mean %.2f ms, p99 %.2f ms' % (
+                self.name, stats['ticks'], stats['overruns'], stats['mean'] * 1000, stats['p99'] * 1000))
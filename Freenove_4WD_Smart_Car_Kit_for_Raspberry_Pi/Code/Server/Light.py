@@ -1,35 +1,46 @@
 import time
 from Motor import *
 from ADC import *
+from ControlLoop import ControlLoop
 
 class Light:
+    rate=20     # ticks per second
+    def setup(self):
+        self.adc=Adc()
+        self.PWM=Motor()
+        self.PWM.setMotorModel(0,0,0,0)
+        self.duties=(0,0,0,0)
+    def sense(self):
+        light,age=self.adc.recvScan((0,1))
+        return light[0],light[1]
+    def decide(self,reading):
+        L,R=reading
+        if L < 2.99 and R < 2.99 :
+            return (600,600,600,600)
+        elif abs(L-R)<0.15:
+            return (0,0,0,0)
+        elif L > 3 or R > 3:
+            if L > R :
+                return (-1200,-1200,1400,1400)
+            elif R > L :
+                return (1400,1400,-1200,-1200)
+        return self.duties
+    def act(self,duties):
+        if duties!=self.duties:
+            self.PWM.setMotorModel(*duties)
+            self.duties=duties
+    def teardown(self):
+        self.PWM.setMotorModel(0,0,0,0)
     def run(self):
-        try:
-            self.adc=Adc()
-            self.PWM=Motor()
-            self.PWM.setMotorModel(0,0,0,0)
-            while True:
-                L = self.adc.recvADC(0)
-                R = self.adc.recvADC(1)
-                if L < 2.99 and R < 2.99 :
-                    self.PWM.setMotorModel(600,600,600,600)
-                elif abs(L-R)<0.15:
-                    self.PWM.setMotorModel(0,0,0,0)
-                    
-                elif L > 3 or R > 3:
-                    if L > R :
-                        self.PWM.setMotorModel(-1200,-1200,1400,1400)
-                        
-                    elif R > L :
-                        self.PWM.setMotorModel(1400,1400,-1200,-1200)
-                    
-        except KeyboardInterrupt:
-           led_Car.PWM.setMotorModel(0,0,0,0) 
+        ControlLoop(self,self.rate).run()
 
 if __name__=='__main__':
     print ('Program is starting ... ')
     led_Car=Light()
-    led_Car.run()
+    try:
+        led_Car.run()
+    except KeyboardInterrupt:
+        pass
 
 
         
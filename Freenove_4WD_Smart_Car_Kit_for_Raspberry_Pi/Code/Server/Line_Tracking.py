@@ -1,37 +1,70 @@
+import threading
 import time
 from Motor import *
 import RPi.GPIO as GPIO
+from ControlLoop import ControlLoop
+# LMR state (left=4, middle=2, right=1) -> wheel duties; other states keep the last command
+MOTOR_TABLE={
+    2:(800,800,800,800),
+    4:(-1500,-1500,2500,2500),
+    6:(-2000,-2000,4000,4000),
+    1:(2500,2500,-1500,-1500),
+    3:(4000,4000,-2000,-2000),
+    7:(0,0,0,0),
+}
 class Line_Tracking:
     def __init__(self):
         self.IR01 = 14
         self.IR02 = 15
         self.IR03 = 23
+        self.rate = 100         # ticks per second, bounds the reaction time to an edge
+        self.period = 0.02      # longest time between reads when no edge arrives
+        self.read_at = 0.0      # monotonic time of the last read
+        self.LMR=None
+        self.changed=threading.Event()
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.IR01,GPIO.IN)
         GPIO.setup(self.IR02,GPIO.IN)
         GPIO.setup(self.IR03,GPIO.IN)
+    def readLMR(self):
+        "Reads the three sensors until two passes agree, so a state is never mixed from two moments"
+        state=None
+        for i in range(3):
+            sample=(4 if GPIO.input(self.IR01) else 0)|(2 if GPIO.input(self.IR02) else 0)|(1 if GPIO.input(self.IR03) else 0)
+            if sample==state:
+                break
+            state=sample
+        return state
+    def onEdge(self,channel):
+        self.changed.set()
+    def setup(self):
+        for pin in (self.IR01,self.IR02,self.IR03):
+            GPIO.add_event_detect(pin,GPIO.BOTH,callback=self.onEdge)
+        self.LMR=None
+        self.changed.set()
+    def sense(self):
+        "Re-reads the sensors after an edge, or every `period` in case an edge is missed"
+        now = time.monotonic()
+        if not self.changed.is_set() and now - self.read_at < self.period:
+            return self.LMR
+        self.changed.clear()
+        self.read_at = now
+        return self.readLMR()
+    def decide(self,LMR):
+        "Wheel duties for a new state, None when nothing has to be written"
+        if LMR==self.LMR:
+            return None
+        self.LMR=LMR
+        return MOTOR_TABLE.get(LMR)
+    def act(self,duties):
+        if duties is not None:
+            PWM.setMotorModel(*duties)
+    def teardown(self):
+        for pin in (self.IR01,self.IR02,self.IR03):
+            GPIO.remove_event_detect(pin)
+        PWM.setMotorModel(0,0,0,0)
     def run(self):
-        while True:
-            self.LMR=0x00
-            if GPIO.input(self.IR01)==True:
-                self.LMR=(self.LMR | 4)
-            if GPIO.input(self.IR02)==True:
-                self.LMR=(self.LMR | 2)
-            if GPIO.input(self.IR03)==True:
-                self.LMR=(self.LMR | 1)
-            if self.LMR==2:
-                PWM.setMotorModel(800,800,800,800)
-            elif self.LMR==4:
-                PWM.setMotorModel(-1500,-1500,2500,2500)
-            elif self.LMR==6:
-                PWM.setMotorModel(-2000,-2000,4000,4000)
-            elif self.LMR==1:
-                PWM.setMotorModel(2500,2500,-1500,-1500)
-            elif self.LMR==3:
-                PWM.setMotorModel(4000,4000,-2000,-2000)
-            elif self.LMR==7:
-                #pass
-                PWM.setMotorModel(0,0,0,0)
+        ControlLoop(self,self.rate).run()
             
 infrared=Line_Tracking()
 # Main program logic follows:
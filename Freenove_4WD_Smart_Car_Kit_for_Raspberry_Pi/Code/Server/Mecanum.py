@@ -0,0 +1,70 @@
+import math
+import numpy as np
+
+# ============================================================================
+# Mecanum wheel kinematics
+# vx: strafe, positive to the right
+# vy: forward, positive ahead
+# omega: rotation, positive counterclockwise (turning left)
+# Headings are in degrees, 0 = ahead and 90 = left, as sent by the client.
+# Wheel duties are returned as (FL, BL, FR, BR), the argument order of
+# Motor.setMotorModel.
+# ============================================================================
+
+# The protocol only carries whole degrees, so sin/cos come from a table
+SIN_TABLE = [math.sin(math.radians(i)) for i in range(360)]
+COS_TABLE = [math.cos(math.radians(i)) for i in range(360)]
+SIN_ARRAY = np.array(SIN_TABLE)
+COS_ARRAY = np.array(COS_TABLE)
+
+
+def sin_cos(angle):
+    "sin and cos of angle in degrees, from the table for whole degrees"
+    if angle == int(angle):
+        i = int(angle) % 360
+        return SIN_TABLE[i], COS_TABLE[i]
+    rad = math.radians(angle)
+    return math.sin(rad), math.cos(rad)
+
+
+def polar(angle, speed):
+    "Heading and speed to (vx, vy)"
+    s, c = sin_cos(angle)
+    return -int(speed * s), int(speed * c)
+
+
+def wheels(vx, vy, omega, limit=None):
+    "Body velocity to (FL, BL, FR, BR), optionally clamped to +-limit"
+    duties = (vy + vx - omega, vy - vx - omega, vy - vx + omega, vy + vx + omega)
+    if limit is not None:
+        duties = tuple(max(min(duty, limit), -limit) for duty in duties)
+    return duties
+
+
+def drive(angle, speed, turn_angle=0, turn_speed=0):
+    "The CMD_M_MOTOR fields (heading, speed, turn heading, turn speed) to wheel duties"
+    vx, vy = polar(angle, speed)
+    s, c = sin_cos(turn_angle)
+    return wheels(vx, vy, int(turn_speed * s))
+
+
+def polar_batch(angles, speeds):
+    "Vectorized polar(): arrays of headings and speeds to arrays vx, vy"
+    angles = np.asarray(angles)
+    speeds = np.asarray(speeds, dtype=float)
+    if np.issubdtype(angles.dtype, np.integer):
+        index = np.mod(angles, 360)
+        s, c = SIN_ARRAY[index], COS_ARRAY[index]
+    else:
+        rad = np.radians(angles)
+        s, c = np.sin(rad), np.cos(rad)
+    return -np.trunc(speeds * s).astype(int), np.trunc(speeds * c).astype(int)
+
+
+def wheels_batch(vx, vy, omega, limit=4095):
+    "Vectorized wheels(): returns an (N, 4) int array of FL, BL, FR, BR duties"
+    vx, vy, omega = np.broadcast_arrays(np.asarray(vx), np.asarray(vy), np.asarray(omega))
+    duties = np.stack((vy + vx - omega, vy - vx - omega, vy - vx + omega, vy + vx + omega), axis=-1)
+    if limit is not None:
+        duties = np.clip(duties, -limit, limit)
+    return duties.astype(int)
@@ -1,16 +1,19 @@
 import math
-from PCA9685 import PCA9685
+import Mecanum
+from Rotation import RotateEngine
+from I2CBus import getPCA9685
 from ADC import *
+from Battery import getBattery
 import time
 
 
 class Motor:
     def __init__(self):
-        self.pwm = PCA9685(0x40, debug=True)
-        self.pwm.setPWMFreq(50)
+        self.pwm = getPCA9685(0x40, 50)
         self.time_proportion = 2.5  # Depend on your own car,If you want to get the best out of the rotation mode,
         # change the value by experimenting.
         self.adc = Adc()
+        self.rotator = RotateEngine(self, self.time_proportion, self.bat_Compensate)
 
     @staticmethod
     def duty_range(duty1, duty2, duty3, duty4):
@@ -79,31 +82,34 @@ class Motor:
             self.pwm.setMotorPwm(4, 4095)
             self.pwm.setMotorPwm(5, 4095)
 
+    @staticmethod
+    def motor_Channels(duty1, duty2, duty3, duty4):
+        # OFF counts of channels 0-7, same mapping as the four wheel methods above
+        channels = [0] * 8
+        for duty, forward, backward in ((duty1, 1, 0), (duty2, 2, 3), (duty3, 7, 6), (duty4, 5, 4)):
+            if duty > 0:
+                channels[forward] = duty
+            elif duty < 0:
+                channels[backward] = abs(duty)
+            else:
+                channels[forward] = 4095
+                channels[backward] = 4095
+        return channels
+
     def setMotorModel(self, duty1, duty2, duty3, duty4):
         duty1, duty2, duty3, duty4 = self.duty_range(duty1, duty2, duty3, duty4)
-        self.left_Upper_Wheel(duty1)
-        self.left_Lower_Wheel(duty2)
-        self.right_Upper_Wheel(duty3)
-        self.right_Lower_Wheel(duty4)
-
-    def Rotate(self, n):
-        angle = n
-        bat_compensate = 7.5 / (self.adc.recvADC(2) * 3)
-        while True:
-            W = 2000
-
-            VY = int(2000 * math.cos(math.radians(angle)))
-            VX = -int(2000 * math.sin(math.radians(angle)))
-
-            FR = VY - VX + W
-            FL = VY + VX - W
-            BL = VY - VX - W
-            BR = VY + VX + W
-
-            PWM.setMotorModel(FL, BL, FR, BR)
-            print("rotating")
-            time.sleep(5 * self.time_proportion * bat_compensate / 1000)
-            angle -= 5
+        self.pwm.setMotorPwms(0, self.motor_Channels(duty1, duty2, duty3, duty4))
+
+    def emergencyStop(self):
+        # One ALL_LED transaction zeroes every PCA9685 output, servos included
+        self.pwm.setAllPWM(0, 0)
+
+    def bat_Compensate(self):
+        return getBattery(self.adc).compensation(7.5)
+
+    def Rotate(self, n, target=None, duration=None):
+        # Blocks until `target` degrees or `duration` seconds have passed, or rotator.stop()
+        self.rotator.run(n, target, duration)
 
 
 PWM = Motor()
@@ -0,0 +1,91 @@
+import threading
+from FixedRate import FixedRate
+
+
+class MotorRamp(threading.Thread):
+    """Slew-rate limiter in front of Motor.setMotorModel.
+
+    Commands only change the target duties. A fixed-rate tick moves every
+    wheel toward its target by at most accel/rate (decel/rate when slowing
+    down) and sends one batched setMotorModel per tick, so the I2C write
+    rate is bounded by the tick rate however fast commands arrive. The
+    ramp position is kept as a float and only rounded for the hardware,
+    so steps below one duty count per tick still add up.
+    """
+    def __init__(self, motor, rate=50, accel=16000, decel=32000):
+        super().__init__(name='MotorRamp', daemon=True)
+        self.motor = motor
+        self.period = 1.0 / rate
+        self.schedule = FixedRate(self.period)
+        self.step_up = accel / rate       # duty counts per tick
+        self.step_down = decel / rate
+        self.lock = threading.Lock()
+        self.target = [0, 0, 0, 0]
+        self.current = [0.0, 0.0, 0.0, 0.0]    # ramp position, fractional duties
+        self.written = [0, 0, 0, 0]            # the rounded duties the wheels have
+        self.kwargs = {}
+        self.ticks = 0
+        self.writes = 0
+        self.errors = 0
+
+    def setMotorModel(self, duty1, duty2, duty3, duty4, **kwargs):
+        duties = [max(min(int(duty), 4095), -4095) for duty in (duty1, duty2, duty3, duty4)]
+        with self.lock:
+            self.target = duties
+            self.kwargs = kwargs
+
+    def halt(self):
+        "Zeroes the wheels immediately, bypassing the ramp"
+        with self.lock:
+            # If the write fails, the ramp keeps heading for the zero target on the next ticks
+            self.target = [0, 0, 0, 0]
+            self.motor.setMotorModel(0, 0, 0, 0)
+            self.current = [0.0, 0.0, 0.0, 0.0]
+            self.written = [0, 0, 0, 0]
+
+    def emergencyStop(self):
+        "Cuts every output in one transaction and drops the ramp state"
+        with self.lock:
+            self.target = [0, 0, 0, 0]
+            self.motor.emergencyStop()
+            self.current = [0.0, 0.0, 0.0, 0.0]
+            self.written = [0, 0, 0, 0]
+
+    def step(self):
+        "Advances the ramp by one tick, returns True if new duties were written"
+        with self.lock:
+            self.ticks += 1
+            duties = list(self.current)
+            for i in range(4):
+                current, target = duties[i], self.target[i]
+                if current == target:
+                    continue
+                if abs(target) > abs(current) and target * current >= 0:
+                    limit = self.step_up
+                else:
+                    limit = self.step_down
+                delta = max(min(target - current, limit), -limit)
+                duties[i] = current + delta
+            rounded = [int(round(duty)) for duty in duties]
+            if rounded == self.written:
+                self.current = duties
+                return False
+            try:
+                self.motor.setMotorModel(*rounded, **self.kwargs)
+            except OSError as e:
+                # Keep the duties the wheels really have, the next tick retries
+                self.errors += 1
+                print('MotorRamp write failed: ' + str(e))
+                return False
+            self.current = duties
+            self.written = rounded
+            self.writes += 1
+            return True
+
+    def run(self):
+        self.schedule.run(self.step)
+
+    def stop(self):
+        self.schedule.stop()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,94 @@
+import threading
+import time
+import numpy as np
+
+
+class Scanner(threading.Thread):
+    """Sweeps the pan servo back and forth and keeps a polar range array.
+
+    ranges[i] is the last distance (cm) measured at angles[i], stamps[i]
+    its time.monotonic() stamp. Each stop waits only as long as the servo
+    needs to get there, settle_base + |delta angle| * sec_per_deg, instead
+    of a fixed sleep. Only this thread writes the arrays, one element at a
+    time, so readers use snapshot() or sector() without taking a lock.
+    A stop whose servo move or measurement fails is counted in `errors`
+    and skipped, so its reading ages out instead of being replaced. A
+    stop without an echo (measure() returns None) stores NaN, not 0 cm.
+    """
+    def __init__(self, servo, ultrasonic, low=30, high=150, resolution=10, channel='0',
+                 settle_base=0.02, sec_per_deg=0.002):
+        super().__init__(name='Scanner', daemon=True)
+        self.servo = servo
+        self.ultrasonic = ultrasonic
+        self.channel = channel
+        self.settle_base = settle_base
+        self.sec_per_deg = sec_per_deg    # servo speed, about 0.12s/60deg under load
+        self.angles = np.arange(low, high + 1, resolution)
+        self.ranges = np.full(len(self.angles), np.nan)
+        self.stamps = np.zeros(len(self.angles))
+        self.index = 0
+        self.direction = 1
+        self.position = None
+        self.sweeps = 0
+        self.errors = 0
+        self.ready = threading.Event()    # set once every angle has a reading
+        self.stop_event = threading.Event()
+
+    def settleTime(self, angle):
+        if self.position is None:
+            return self.settle_base + (self.angles[-1] - self.angles[0]) * self.sec_per_deg
+        return self.settle_base + abs(angle - self.position) * self.sec_per_deg
+
+    def step(self):
+        "Moves to the next angle, waits for the servo and stores one reading"
+        angle = int(self.angles[self.index])
+        self.servo.setServoPwm(self.channel, angle)
+        settle = self.settleTime(angle)
+        self.position = angle
+        if self.stop_event.wait(settle):
+            return
+        distance = self.ultrasonic.measure()
+        self.ranges[self.index] = np.nan if distance is None else distance
+        self.stamps[self.index] = time.monotonic()
+        self.advance()
+
+    def advance(self):
+        if len(self.angles) == 1:
+            self.ready.set()
+            return
+        # Bounce at both ends so the servo never jumps across the whole range
+        if not 0 <= self.index + self.direction < len(self.angles):
+            self.direction = -self.direction
+            self.sweeps += 1
+            self.ready.set()
+        self.index += self.direction
+
+    def snapshot(self):
+        "Copies of (angles, ranges, stamps); a copy may straddle two sweeps"
+        return self.angles, self.ranges.copy(), self.stamps.copy()
+
+    def sector(self, low, high, max_age=None):
+        "Nearest range between low and high degrees, NaN if there is no (fresh) reading"
+        angles, ranges, stamps = self.snapshot()
+        mask = (angles >= low) & (angles <= high)
+        if max_age is not None:
+            mask &= stamps >= time.monotonic() - max_age
+        ranges = ranges[mask]
+        ranges = ranges[~np.isnan(ranges)]
+        return float(ranges.min()) if len(ranges) else float('nan')
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                self.errors += 1
+                print('Scanner step failed: ' + str(e))
+                self.position = None    # the servo may be anywhere, allow a full move
+                self.advance()
+                self.stop_event.wait(self.settle_base)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join()
@@ -1,87 +1,232 @@
+import threading
 import time
 from Motor import *
 import RPi.GPIO as GPIO
 from servo import *
 from PCA9685 import PCA9685
+from Filters import RunningMedian
+from FixedRate import FixedRate
+from Scanner import Scanner
+from ControlLoop import ControlLoop
+
+
+class EchoTimer(threading.Thread):
+    """Measures HC-SR04 echoes from GPIO edge interrupts.
+
+    A pinger thread fires the trigger at a fixed rate, the echo pin's
+    rising and falling edges are timestamped with time.monotonic() in the
+    GPIO callback, and every completed echo updates a running median.
+    Each ping arms the callback for a rising edge, and the edge after it
+    is the fall. The pin level is not read back, as a short echo has
+    already ended by the time the callback runs. The
+    echo pin's edge detection can only be registered once, so all
+    Ultrasonic instances share one timer (see getEchoTimer()).
+    """
+    def __init__(self, trigger_pin=27, echo_pin=22, max_distance=300, rate=15, window=5):
+        super().__init__(name='EchoTimer', daemon=True)
+        self.trigger_pin = trigger_pin
+        self.echo_pin = echo_pin
+        self.timeout = max_distance * 2 / 34300.0  # round trip at 340m/s, unit: s
+        self.period = max(1.0 / rate, 0.06)        # the module needs 60ms between pings
+        self.schedule = FixedRate(self.period)
+        self.median = RunningMedian(window)
+        self.lock = threading.Lock()
+        self.echo = threading.Condition(self.lock)
+        self.armed = False        # a ping went out and its rising edge is still due
+        self.rise = None
+        self.distance = 0.0
+        self.raw = 0.0            # last single echo, unit: cm
+        self.raw_rise = 0.0       # monotonic time of its rising edge
+        self.stamp = None
+        self.count = 0
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.trigger_pin, GPIO.OUT)
+        GPIO.setup(self.echo_pin, GPIO.IN)
+        GPIO.output(self.trigger_pin, GPIO.LOW)
+        GPIO.add_event_detect(self.echo_pin, GPIO.BOTH, callback=self.onEdge)
+
+    def onEdge(self, channel):
+        now = time.monotonic()
+        if self.rise is None:
+            if self.armed:
+                self.armed = False
+                self.rise = now
+            return
+        pulse = min(now - self.rise, self.timeout)  # nothing in range reads as max_distance
+        with self.echo:
+            self.raw = pulse * 34300.0 / 2.0  # cm
+            self.raw_rise = self.rise
+            self.distance = self.median.update(self.raw)
+            self.stamp = now
+            self.count += 1
+            self.echo.notify_all()
+        self.rise = None
+
+    def ping(self):
+        self.rise = None
+        self.armed = True
+        GPIO.output(self.trigger_pin, GPIO.HIGH)  # make trigger_pin output 10us HIGH level
+        time.sleep(0.00001)  # 10us
+        GPIO.output(self.trigger_pin, GPIO.LOW)
+
+    def setWindow(self, window):
+        with self.lock:
+            self.median = RunningMedian(window)
+
+    def read(self):
+        "Latest median distance in cm and its age in seconds (None before the first echo)"
+        with self.lock:
+            if self.stamp is None:
+                return self.distance, None
+            return self.distance, time.monotonic() - self.stamp
+
+    def waitEcho(self, count, timeout):
+        "Blocks until more than `count` echoes have been measured or timeout"
+        with self.echo:
+            return self.echo.wait_for(lambda: self.count > count, timeout)
+
+    def measureAfter(self, since, timeout):
+        "Distance of the first echo whose ping went out after `since`, None on timeout"
+        with self.echo:
+            if self.echo.wait_for(lambda: self.raw_rise >= since, timeout):
+                return self.raw
+            return None
+
+    def run(self):
+        self.schedule.run(self.ping)
+
+    def stop(self):
+        self.schedule.stop()
+        if self.is_alive():
+            self.join()
+
+
+_echo_timer = None
+_echo_lock = threading.Lock()
+
+
+def getEchoTimer(**kwargs):
+    "The process-wide EchoTimer, started on first use"
+    global _echo_timer
+    with _echo_lock:
+        if _echo_timer is None:
+            _echo_timer = EchoTimer(**kwargs)
+            _echo_timer.start()
+        return _echo_timer
 
 
 class Ultrasonic:
-    def __init__(self):
+    def __init__(self, window=5, rate=15):
         GPIO.setwarnings(False)
         self.trigger_pin = 27
         self.echo_pin = 22
         self.MAX_DISTANCE = 300  # define the maximum measuring distance, unit: cm
-        self.timeOut = self.MAX_DISTANCE * 60  # calculate timeout according to the maximum measuring distance
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.trigger_pin, GPIO.OUT)
-        GPIO.setup(self.echo_pin, GPIO.IN)
+        self.max_age = 0.5       # readings older than this wait for a fresh echo, unit: s
+        self.window = window
+        self.rate = rate
+        self.loop_rate = 20      # obstacle avoidance ticks per second
+        self.sector_age = 3.0    # older sector readings count as missing, about two sweeps, unit: s
+        self.reverse_time = 0.1  # how long to back off before turning away, unit: s
+        self.pending = None      # (duties, monotonic time) of the turn that follows a reverse
+        self.decided = 0.0       # scanner stamp of the newest reading acted on
+        self.timer = None
 
-    def pulseIn(self, pin, level, timeOut):  # obtain pulse time of a pin under timeOut
-        t0 = time.time()
-        while (GPIO.input(pin) != level):
-            if ((time.time() - t0) > timeOut * 0.000001):
-                return 0;
-        t0 = time.time()
-        while (GPIO.input(pin) == level):
-            if ((time.time() - t0) > timeOut * 0.000001):
-                return 0;
-        pulseTime = (time.time() - t0) * 1000000
-        return pulseTime
+    def start(self):
+        if self.timer is None:
+            self.timer = getEchoTimer(trigger_pin=self.trigger_pin, echo_pin=self.echo_pin,
+                                      max_distance=self.MAX_DISTANCE, rate=self.rate, window=self.window)
+        return self.timer
 
     def get_distance(self):  # get the measurement results of ultrasonic module,with unit: cm
-        distance_cm = [0, 0, 0, 0, 0]
-        for i in range(5):
-            GPIO.output(self.trigger_pin, GPIO.HIGH)  # make trigger_pin output 10us HIGH level
-            time.sleep(0.00001)  # 10us
-            GPIO.output(self.trigger_pin, GPIO.LOW)  # make trigger_pin output LOW level
-            pingTime = self.pulseIn(self.echo_pin, GPIO.HIGH, self.timeOut)  # read plus time of echo_pin
-            distance_cm[i] = pingTime * 340.0 / 2.0 / 10000.0  # calculate distance with sound speed 340m/s
-        distance_cm = sorted(distance_cm)
-        return int(distance_cm[2])
+        timer = self.start()
+        distance, age = timer.read()
+        if age is None or age > self.max_age:
+            # No recent echo (first call or no obstacle in range), give the pinger one more cycle
+            with timer.lock:
+                count = timer.count
+            timer.waitEcho(count, timer.period * 2)
+            distance, age = timer.read()
+        return int(distance)
 
-    def run_motor(self, L, M, R):
+    def measure(self):  # one fresh echo taken after the call, for moving sensors, unit: cm (None if no echo)
+        timer = self.start()
+        distance = timer.measureAfter(time.monotonic(), timer.period * 2 + timer.timeout)
+        return None if distance is None else int(distance)
+
+    def choose(self, L, M, R):
+        "Duties for the sector distances, and the duties to switch to after reverse_time (or None)"
         if (L < 30 and M < 30 and R < 30) or M < 30:
-            self.PWM.setMotorModel(-1000, -1000, -1000, -1000)
-            time.sleep(0.1)
             if L < R:
-                self.PWM.setMotorModel(1000, 1000, -1000, -1000)
-            else:
-                self.PWM.setMotorModel(-1000, -1000, 1000, 1000)
+                return (-1000, -1000, -1000, -1000), (1000, 1000, -1000, -1000)
+            return (-1000, -1000, -1000, -1000), (-1000, -1000, 1000, 1000)
         elif L < 30 and M < 30:
-            PWM.setMotorModel(1500, 1500, -1500, -1500)
+            return (1500, 1500, -1500, -1500), None
         elif R < 30 and M < 30:
-            PWM.setMotorModel(-1500, -1500, 1500, 1500)
+            return (-1500, -1500, 1500, 1500), None
         elif L < 20:
-            PWM.setMotorModel(1500, 1500, -500, -500)
             if L < 10:
-                PWM.setMotorModel(1500, 1500, -1000, -1000)
+                return (1500, 1500, -1000, -1000), None
+            return (1500, 1500, -500, -500), None
         elif R < 20:
-            PWM.setMotorModel(-500, -500, 1500, 1500)
             if R < 10:
-                PWM.setMotorModel(-1000, -1000, 1000, 1000)
-        else:
-            self.PWM.setMotorModel(600, 600, 600, 600)
+                return (-1000, -1000, 1000, 1000), None
+            return (-500, -500, 1500, 1500), None
+        return (600, 600, 600, 600), None
 
-    def run(self):
+    def run_motor(self, L, M, R):
+        duties, then = self.choose(L, M, R)
+        self.PWM.setMotorModel(*duties)
+        # The turn after a reverse is written by a later tick, see decide()
+        self.pending = None if then is None else (then, time.monotonic() + self.reverse_time)
+
+    def setup(self):
         self.PWM = Motor()
         self.pwm_S = Servo()
+        self.scanner = Scanner(self.pwm_S, self)
+        self.scanner.start()
+        self.pending = None
+        self.decided = 0.0
 
-        while True:
-            self.pwm_S.setServoPwm("0", 90)
-            time.sleep(0.1)
-            M = self.get_distance()
+    def sense(self):
+        if not self.scanner.ready.is_set():
+            return None  # wait for the first full sweep
+        age = self.sector_age
+        return (self.scanner.sector(30, 60, age), self.scanner.sector(70, 110, age),
+                self.scanner.sector(120, 150, age), self.scanner.stamps.max())
 
-            if M < 30:
-                self.pwm_S.setServoPwm("0", 30)
-                time.sleep(0.2)
-                L = self.get_distance()
-                self.pwm_S.setServoPwm("0", 151)
-                time.sleep(0.2)
-                R = self.get_distance()
-                self.run_motor(L, M, R)
-                self.pwm_S.setServoPwm("0", 90)
-            else:
-                self.run_motor(20, M, 20)
+    def decide(self, reading):
+        "Duties to write this tick, or None to keep the current ones"
+        if self.pending is not None:
+            then, until = self.pending
+            if time.monotonic() < until:
+                return None
+            self.pending = None
+            return then
+        if reading is None:
+            return None
+        L, M, R, stamp = reading
+        if stamp <= self.decided:
+            return None  # no new reading since the last decision
+        self.decided = stamp
+        if L != L or M != M or R != R:
+            # A sector has no fresh reading (NaN), the scanner has stalled
+            return (0, 0, 0, 0)
+        duties, then = self.choose(L, M, R)
+        if then is not None:
+            self.pending = (then, time.monotonic() + self.reverse_time)
+        return duties
+
+    def act(self, duties):
+        if duties is not None:
+            self.PWM.setMotorModel(*duties)
+
+    def teardown(self):
+        self.scanner.stop()
+        self.PWM.setMotorModel(0, 0, 0, 0)
+        self.pwm_S.setServoPwm('0', 90)
+
+    def run(self):
+        ControlLoop(self, self.loop_rate).run()
 
     def run0(self):
         self.PWM = Motor()
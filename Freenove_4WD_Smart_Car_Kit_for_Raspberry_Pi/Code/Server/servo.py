@@ -1,10 +1,9 @@
-from PCA9685 import PCA9685
+from I2CBus import getPCA9685
 
 
 class Servo:
     def __init__(self):
-        self.PwmServo = PCA9685(0x40, debug=True)
-        self.PwmServo.setPWMFreq(50)
+        self.PwmServo = getPCA9685(0x40, 50, exact=True)
         self.PwmServo.setServoPulse(8, 1500)
         self.PwmServo.setServoPulse(9, 1500)
 
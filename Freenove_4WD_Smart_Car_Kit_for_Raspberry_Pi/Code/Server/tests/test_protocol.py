@@ -0,0 +1,87 @@
+from Protocol import HEADER, MAGIC, DatagramFilter, StreamDecoder, encode, encodeDatagram, encodeLine
+
+
+def test_text_and_binary_mixed():
+    decoder = StreamDecoder()
+    data = b'CMD_LED_MOD#1\n' + encode('CMD_MOTOR', 100, -100, 200, -200) + b'CMD_POWER\n'
+    assert decoder.feed(data) == [['CMD_LED_MOD', '1'],
+                                  ['CMD_MOTOR', '100', '-100', '200', '-200'],
+                                  ['CMD_POWER']]
+    assert (decoder.lines, decoder.frames, decoder.errors) == (2, 1, 0)
+
+
+def test_byte_by_byte():
+    decoder = StreamDecoder()
+    data = encode('CMD_SERVO', 0, 90) + b'CMD_BUZZER#1\n' + encode('CMD_MODE', 3)
+    commands = []
+    for i in range(len(data)):
+        commands += decoder.feed(data[i:i + 1])
+    assert commands == [['CMD_SERVO', '0', '90'], ['CMD_BUZZER', '1'], ['CMD_MODE', '3']]
+    assert not decoder.buffer
+
+
+def test_partial_tail_is_kept():
+    decoder = StreamDecoder()
+    frame = encode('CMD_MOTOR', 1, 2, 3, 4)
+    assert decoder.feed(b'CMD_SONIC#1\nCMD_LI') == [['CMD_SONIC', '1']]
+    assert decoder.feed(b'GHT#0\n' + frame[:3]) == [['CMD_LIGHT', '0']]
+    assert decoder.feed(frame[3:]) == [['CMD_MOTOR', '1', '2', '3', '4']]
+
+
+def test_bad_frames_are_skipped():
+    decoder = StreamDecoder()
+    unknown = HEADER.pack(MAGIC, 1, 0x7F, 2) + b'\x00\x00'
+    version = HEADER.pack(MAGIC, 9, 0x08, 1) + b'\x01'
+    length = HEADER.pack(MAGIC, 1, 0x08, 2) + b'\x01\x00'
+    data = unknown + version + length + b'CMD_POWER\n'
+    assert decoder.feed(data) == [['CMD_POWER']]
+    assert decoder.errors == 3
+
+
+def test_encode_line_round_trip():
+    line = 'CMD_MOTOR#1#2#3#4\nCMD_MODE#three\nCMD_LED#1#2#3#4#5\nCMD_SERVO#0#99999\n'
+    data = encodeLine(line)
+    assert data[0] == MAGIC
+    assert StreamDecoder().feed(data) == [['CMD_MOTOR', '1', '2', '3', '4'],
+                                          ['CMD_MODE', '3'],
+                                          ['CMD_LED', '1', '2', '3', '4', '5'],
+                                          ['CMD_SERVO', '0', '99999']]
+
+
+def test_datagram_reorder_and_loss():
+    dfilter = DatagramFilter()
+    line = 'CMD_MOTOR#1#2#3#4\n'
+    assert dfilter.feed(encodeDatagram(1, line, 1000), now=1010) == [['CMD_MOTOR', '1', '2', '3', '4']]
+    assert dfilter.feed(encodeDatagram(4, line, 1030), now=1040)
+    assert dfilter.feed(encodeDatagram(3, line, 1020), now=1045) == []
+    assert dfilter.feed(encodeDatagram(4, line, 1030), now=1046) == []
+    assert dfilter.feed(b'\x00') == []
+    assert dfilter.stats() == {'received': 4, 'accepted': 2, 'lost': 2,
+                               'reordered': 2, 'stale': 0, 'errors': 1}
+
+
+def test_datagram_sequence_wraps():
+    dfilter = DatagramFilter()
+    assert dfilter.feed(encodeDatagram(0xFFFFFFFF, 'CMD_POWER\n', 0), now=5)
+    assert dfilter.feed(encodeDatagram(0x100000000, 'CMD_POWER\n', 10), now=15)
+    assert dfilter.stats()['reordered'] == 0
+
+
+def test_datagram_stale():
+    dfilter = DatagramFilter(max_age=0.2)
+    assert dfilter.feed(encodeDatagram(1, 'CMD_POWER\n', 1000), now=1005)
+    assert dfilter.feed(encodeDatagram(2, 'CMD_POWER\n', 1050), now=1300) == []
+    assert dfilter.feed(encodeDatagram(3, 'CMD_POWER\n', 1300), now=1306)
+    assert dfilter.stale == 1
+
+
+def test_datagram_drifting_clock():
+    # The sender's clock runs 50 ppm slow, so transit grows by 180 ms per hour
+    dfilter = DatagramFilter(max_age=0.2)
+    for seq in range(0, 3 * 3600 * 20):
+        now = 1000000 + seq * 50
+        stamp = int((now - 1000000) * (1 - 50e-6)) + 5
+        assert dfilter.feed(encodeDatagram(seq, 'CMD_POWER\n', stamp), now=now)
+    # A genuinely late datagram is still dropped after hours of drift
+    assert dfilter.feed(encodeDatagram(seq + 1, 'CMD_POWER\n', stamp + 50), now=now + 350) == []
+    assert dfilter.stale == 1
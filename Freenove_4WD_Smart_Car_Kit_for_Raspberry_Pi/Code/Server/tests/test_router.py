@@ -0,0 +1,81 @@
+from Router import CommandRouter
+
+
+def make():
+    router = CommandRouter()
+    calls = []
+    router.register('CMD_MOTOR', lambda *args: calls.append(('motor',) + args), int, int, int, int)
+    router.register('CMD_POWER', lambda: calls.append(('power',)))
+    return router, calls
+
+
+def test_dispatch_parses_fields():
+    router, calls = make()
+    assert router.dispatch(['CMD_MOTOR', '1', '-2', '3', '-4'])
+    assert router.dispatch(['CMD_POWER'])
+    assert calls == [('motor', 1, -2, 3, -4), ('power',)]
+    assert router.stats()['CMD_MOTOR']['calls'] == 1
+
+
+def test_bad_commands_are_counted():
+    router, calls = make()
+    assert not router.dispatch(['CMD_MOTOR', '1', '2'])
+    assert not router.dispatch(['CMD_MOTOR', '1', 'x', '3', '4'])
+    assert not router.dispatch(['CMD_NOPE'])
+    assert not router.dispatch([''])
+    assert calls == []
+    assert router.stats()['CMD_MOTOR']['errors'] == 2
+    assert router.unknown == 1
+
+
+def test_guard_skips():
+    router = CommandRouter()
+    calls = []
+    allowed = [False]
+    router.register('CMD_SERVO', lambda *args: calls.append(args), str, int, guard=lambda: allowed[0])
+    assert not router.dispatch(['CMD_SERVO', '0', '90'])
+    allowed[0] = True
+    assert router.dispatch(['CMD_SERVO', '0', '90'])
+    assert calls == [('0', 90)]
+    assert router.stats()['CMD_SERVO']['skipped'] == 1
+
+
+def test_handler_failure_is_counted():
+    router = CommandRouter()
+
+    def fail():
+        raise OSError('bus')
+    router.register('CMD_POWER', fail)
+    assert router.dispatch(['CMD_POWER'])
+    assert router.stats()['CMD_POWER']['errors'] == 1
+
+
+def test_batch_runs_newest_per_key_in_place():
+    router = CommandRouter()
+    calls = []
+    router.register('CMD_MOTOR', lambda *args: calls.append(('motor',) + args), int, int, int, int, key='motion')
+    router.register('CMD_M_MOTOR', lambda *args: calls.append(('m_motor',) + args), int, int, int, int, key='motion')
+    router.register('CMD_SERVO', lambda *args: calls.append(('servo',) + args), str, int,
+                    key=lambda channel, angle: 'servo' + channel)
+    router.register('CMD_BUZZER', lambda *args: calls.append(('buzzer',) + args), int)
+    batch = [['CMD_MOTOR', '1', '1', '1', '1'],
+             ['CMD_SERVO', '0', '10'],
+             ['CMD_BUZZER', '1'],
+             ['CMD_SERVO', '1', '20'],
+             ['CMD_M_MOTOR', '0', '500', '0', '0'],
+             ['CMD_SERVO', '0', '30'],
+             ['CMD_BUZZER', '0']]
+    assert router.dispatchBatch(batch) == 5
+    assert calls == [('buzzer', 1), ('servo', '1', 20), ('m_motor', 0, 500, 0, 0),
+                     ('servo', '0', 30), ('buzzer', 0)]
+    assert router.coalesced == 2
+    assert router.stats()['CMD_MOTOR']['coalesced'] == 1
+
+
+def test_batch_skips_rejected_commands():
+    router = CommandRouter()
+    calls = []
+    router.register('CMD_MOTOR', lambda *args: calls.append(args), int, int, int, int, key='motion')
+    # A malformed newer command does not supersede the valid one before it
+    assert router.dispatchBatch([['CMD_MOTOR', '1', '2', '3', '4'], ['CMD_MOTOR', 'x'], []]) == 1
+    assert calls == [(1, 2, 3, 4)]